@@ -1,5 +1,8 @@
-from app.utils.format import prompt_template, parse_json_response
-from app.utils.bedrock import WrapperBedrock, ConverseMessage
+from app.utils.format import prompt_template, parse_json_response, JsonStreamParser
+from app.utils.bedrock import WrapperBedrock, ConverseMessage, tool_config_for, structured_output_text
+from app.utils.gazetteer import normalize_name
+from app.retrieval import chunk_tokens
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
 
 RISQUES = [
@@ -51,7 +54,7 @@ def risk_analysis_prompt(liste_risques: list[str], doc: str) -> str:
 
     **Tâches à effectuer** :
     - Identifier les passages du document mentionnant un ou plusieurs des risques listés.
-    - Extraire les passages qui identifient les risques.
+    - Extraire les passages qui identifient les risques, en citant la page indiquée par le marqueur `[page N]` qui les précède.
     - Extraire les passages qui mentionnent un éventuel plan d’adaptation pour ces risques (laisser `null` si aucun plan n'est mentionné).
     - Attribuer une note de pertinence de 1 à 10 en fonction de la qualité des informations fournies sur les risques et les stratégies d’adaptation.
     - Justifier la note attribuée.
@@ -94,13 +97,41 @@ def risk_analysis_prompt(liste_risques: list[str], doc: str) -> str:
     pass
 
 
+def recover_truncated_analysis(text: str) -> RiskAnalysisOutput:
+    """
+    Récupère les risques complets d'une réponse d'analyse coupée par la limite de tokens.
+
+    Args:
+        text (str): Réponse tronquée du modèle.
+
+    Returns:
+        RiskAnalysisOutput: Analyse avec les risques complets, notée 0 si la note n'a pas été générée.
+
+    Raises:
+        ValueError: Si aucun risque complet n'a pu être récupéré.
+    """
+    parser = JsonStreamParser(AnalyzedRisk, key="risques")
+    risques = parser.feed(text)
+    if parser.complete:
+        return RiskAnalysisOutput.model_validate(parser.result())
+    if not risques:
+        raise ValueError("Réponse tronquée sans risque complet")
+    data = parser.result(partial=True)
+    return RiskAnalysisOutput(
+        risques=risques,
+        note=data.get("note", 0),
+        explication=data.get("explication", f"Réponse tronquée, {len(risques)} risques récupérés."))
+
+
 def analyze_doc_risks(
         bedrock: WrapperBedrock,
         doc: str,
         doc_url: str,
         analyse_model_id: str,
         risques: list[str] = None,
-        max_retires: int = 3
+        max_retires: int = 3,
+        max_tokens: int = 8192,
+        structured: bool = True
     ) -> RiskAnalysisOutput:
     """ 
     Effectue l'analyse de risques sur le document spécifié.
@@ -112,6 +143,10 @@ def analyze_doc_risks(
         analyse_model_id (str): ID du modèle d'analyse.
         risques (list[str], optional): Liste des risques à analyser. Defaults to None.
         max_retires (int, optional): Nombre maximal de tentatives pour effectuer l'analyse. Defaults to 3.
+        max_tokens (int, optional): Nombre maximal de tokens de la réponse. Defaults to 8192.
+        structured (bool, optional): Demande d'abord une réponse structurée (tool use) validée par le schéma
+            de `RiskAnalysisOutput`, les tentatives en texte libre ne servant que de repli. Une réponse structurée
+            coupée par la limite de tokens est récupérée comme une réponse texte. Defaults to True.
 
     Returns:
         RiskAnalysisOutput: Résultat de l'analyse.
@@ -119,13 +154,20 @@ def analyze_doc_risks(
     retries = 0
     risques = RISQUES if risques is None else risques
     prompt = risk_analysis_prompt(risques, doc)
+    # réponse structurée (tool use) d'abord, puis réponses texte en repli
+    tool_config = tool_config_for(RiskAnalysisOutput) if structured else None
     while retries < max_retires:
         try:
-            analysis_response = bedrock.converse(model_id=analyse_model_id, messages=[
-                                                ConverseMessage.make_user_message(prompt)],
-                                                max_tokens=8192)
-            out = RiskAnalysisOutput.model_validate(
-                parse_json_response(analysis_response.content[0].text))
+            analysis_response = bedrock.converse_raw(model_id=analyse_model_id, messages=[
+                                                    ConverseMessage.make_user_message(prompt)],
+                                                    max_tokens=max_tokens, tool_config=tool_config)
+            text = structured_output_text(analysis_response)
+            if analysis_response.get("stopReason") == "max_tokens":
+                # réponse coupée par la limite de tokens : les risques complets sont conservés plutôt que de relancer l'analyse
+                out = recover_truncated_analysis(text)
+            else:
+                out = RiskAnalysisOutput.model_validate(
+                    parse_json_response(text))
             out.url = doc_url
             break
         except Exception as e:
@@ -133,6 +175,9 @@ def analyze_doc_risks(
             if retries >= max_retires:
                 raise e
             else:
+                if tool_config is not None:
+                    print(f"Réponse structurée invalide pour {doc_url}, repli sur la réponse texte : {e}")
+                    tool_config = None
                 # bail out prompt
                 instruction = (
                     "Veuillez vérifier le format du prompt ainsi que le nombre de tokens utilisés dans la requête. "
@@ -152,4 +197,87 @@ def analyze_doc_risks(
                 )
                 prompt += instruction
         
-    return out
\ No newline at end of file
+    return out
+
+
+def merge_risk_analyses(analyses: list[RiskAnalysisOutput], doc_url: str) -> RiskAnalysisOutput:
+    """
+    Fusionne localement les analyses des morceaux d'un document : les risques de même nom sont regroupés
+    et leurs passages concaténés sans doublons.
+
+    Args:
+        analyses (list[RiskAnalysisOutput]): Analyses des morceaux, dans l'ordre du document.
+        doc_url (str): URL du document.
+
+    Returns:
+        RiskAnalysisOutput: Analyse du document complet, notée comme le meilleur de ses morceaux.
+    """
+    merged: dict[str, dict[str, list[str]]] = {}
+    names: dict[str, str] = {}
+    for analysis in analyses:
+        for risk in analysis.risques:
+            key = normalize_name(risk.nom_risque)
+            names.setdefault(key, risk.nom_risque)
+            passages = merged.setdefault(
+                key, {"identification_risque": [], "plan_adaptation_risque": []})
+            for field in passages:
+                value = getattr(risk, field)
+                if value and value not in passages[field]:
+                    passages[field].append(value)
+
+    best = max(analyses, key=lambda a: a.note)
+    return RiskAnalysisOutput(
+        risques=[AnalyzedRisk(nom_risque=names[key],
+                              identification_risque="\n".join(
+                                  passages["identification_risque"]) or None,
+                              plan_adaptation_risque="\n".join(passages["plan_adaptation_risque"]) or None)
+                 for key, passages in merged.items()],
+        note=best.note,
+        explication=best.explication,
+        url=doc_url)
+
+
+def analyze_doc_risks_map_reduce(
+        bedrock: WrapperBedrock,
+        doc: str,
+        doc_url: str,
+        analyse_model_id: str,
+        risques: list[str] = None,
+        chunk_max_tokens: int = 6000,
+        max_tokens: int = 2048,
+        max_workers: int = 4,
+        max_retires: int = 3
+    ) -> RiskAnalysisOutput:
+    """
+    Analyse de risques map-reduce d'un long document : les morceaux sont analysés en parallèle avec un budget de
+    réponse réduit, puis leurs résultats sont fusionnés localement. Seul un morceau en échec est analysé à nouveau.
+
+    Args:
+        bedrock (WrapperBedrock): Instance Bedrock pour effectuer l'analyse.
+        doc (str): Contenu du document à analyser.
+        doc_url (str): URL du document.
+        analyse_model_id (str): ID du modèle d'analyse.
+        risques (list[str], optional): Liste des risques à analyser. Defaults to None.
+        chunk_max_tokens (int, optional): Nombre maximal de tokens d'un morceau. Defaults to 6000.
+        max_tokens (int, optional): Nombre maximal de tokens de la réponse pour un morceau. Defaults to 2048.
+        max_workers (int, optional): Nombre de morceaux analysés en parallèle. Defaults to 4.
+        max_retires (int, optional): Nombre maximal de tentatives par morceau. Defaults to 3.
+
+    Returns:
+        RiskAnalysisOutput: Résultat de l'analyse du document.
+    """
+    chunks = chunk_tokens(doc, chunk_max_tokens)
+
+    def analyze_chunk(chunk: str) -> RiskAnalysisOutput | None:
+        try:
+            return analyze_doc_risks(bedrock, chunk, doc_url, analyse_model_id, risques,
+                                     max_retires=max_retires, max_tokens=max_tokens)
+        except Exception as e:
+            print(f"Echec de l'analyse d'un morceau de {doc_url} : {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks) or 1))) as pool:
+        analyses = [a for a in pool.map(analyze_chunk, chunks) if a is not None]
+    if not analyses:
+        raise ValueError(f"Aucun morceau de {doc_url} n'a pu être analysé")
+    return merge_risk_analyses(analyses, doc_url)
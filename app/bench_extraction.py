@@ -0,0 +1,59 @@
+import argparse
+import glob
+import os
+import time
+import fitz
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.pdf import PdfExtractionPool, iter_pages, pages_to_text, DEFAULT_MAX_CHARS
+
+# Compare le débit d'extraction de texte (séquentiel vs threads vs pool de processus) sur un corpus de PDFs sur disque.
+# usage : python -m app.bench_extraction <dossier ou fichiers PDF> [--workers N] [--rounds N]
+
+
+def load_corpus(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True)) if os.path.isdir(path) else [path]
+    return files
+
+
+def extract_file_text(path: str) -> str:
+    with fitz.open(path) as pdf_document:
+        return pages_to_text(iter_pages(pdf_document, max_chars=DEFAULT_MAX_CHARS))
+
+
+def bench(name: str, corpus: list[str], extract, rounds: int) -> None:
+    start = time.perf_counter()
+    chars = 0
+    for _ in range(rounds):
+        chars += sum(len(text) for text in extract(corpus))
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(path) for path in corpus) * rounds
+    print(f"{name:<12} {elapsed:8.2f} s  {len(corpus) * rounds / elapsed:8.1f} docs/s  "
+          f"{size / elapsed / 2**20:8.1f} Mo/s  {chars / elapsed / 1e6:8.2f} Mcar/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths)
+    print(f"{len(corpus)} PDFs, {sum(os.path.getsize(path) for path in corpus) / 2**20:.1f} Mo, {args.workers} workers")
+
+    # référence : extraction une à une dans le thread principal
+    bench("séquentiel", corpus, lambda docs: [extract_file_text(path) for path in docs], args.rounds)
+
+    with ThreadPoolExecutor(args.workers) as threads:
+        bench("threads", corpus, lambda docs: threads.map(extract_file_text, docs), args.rounds)
+
+    processes = PdfExtractionPool(args.workers)
+    try:
+        # démarrage des processus hors mesure
+        processes.warm_up()
+        bench("processus", corpus, lambda docs: [pages_to_text(f.result()) for f in [processes.submit_file(path) for path in docs]],
+              args.rounds)
+    finally:
+        processes.shutdown()
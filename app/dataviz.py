@@ -129,7 +129,7 @@ def generate_visualization_template(risks: list[str], lieu: str) -> str:
     {
         "visualization_type": "<type de visualisation>",
         "description": "Description succincte de la visualisation et des données utilisées.",
-        "visualization_code": {{ Code Python (ou autre langage) nécessaire pour générer la visualisation. | json }},
+        "visualization_code": "<code Python (ou autre langage) nécessaire pour générer la visualisation>",
         "insights": "Principaux enseignements et conclusions tirés de la visualisation."
     }
 
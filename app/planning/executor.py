@@ -1,12 +1,22 @@
 from .subtasks import SubTask
-from typing import Callable
+from typing import Callable, AsyncIterator
 from functools import wraps
-from ..utils.bedrock import WrapperBedrock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from ..utils.bedrock import WrapperBedrock, AsyncWrapperBedrock
+from ..utils.vector_index import VectorIndex
+from ..utils.scrapper import scrapper as Scrapper
+import asyncio
+import inspect
+import threading
+
+# arguments d'une sous-tâche qui référencent la sortie d'une autre sous-tâche
+DEPENDENCY_ARGS = ("in", "dataviz")
 
 
 def agent_task(name):
     """
     Marque une fonction comme étant une tâche éxecutable par un agent.
+    La fonction peut être une coroutine (`async def`).
     """
     def decorator(func):
         @wraps(func)
@@ -17,12 +27,26 @@ def agent_task(name):
 
 
 class AgentContext:
-    def __init__(self, wrapper: WrapperBedrock):
+    def __init__(self, wrapper: WrapperBedrock, max_workers: int = 4, stream: bool = False, index: VectorIndex | None = None,
+                 scrapper: Scrapper | None = None):
         # les sorties des différentes tâches
         self.outputs: dict[str, dict] = {}
         # les tâches disponibles dans l'agent
         self.tasks: dict[str, Callable] = {}
         self.bedrock = wrapper
+        # client Bedrock pour les tâches coroutines
+        self.abedrock = AsyncWrapperBedrock(wrapper)
+        # nombre maximal de sous-tâches exécutées en même temps
+        self.max_workers = max_workers
+        # les tâches qui le supportent renvoient un itérateur de texte plutôt que le texte complet
+        self.stream = stream
+        # index local des documents et analyses, conservé d'une requête à l'autre
+        self.index = index
+        # scrapper (et sa session HTTP) partagé par les tâches, créé par la première tâche qui en a besoin
+        self.scrapper = scrapper
+        # boucle asyncio (dans son propre thread) où `execute_tasks` exécute les tâches coroutines
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_lock = threading.Lock()
         pass
 
     def register_task(self, task_callable: Callable) -> None:
@@ -35,18 +59,117 @@ class AgentContext:
         """
             Execute une seule tâche et stocke le résultat dans les sorties si une sortie est configurée.
         """
-        output = self.tasks[task.task](self, task.args)
+        func = self.tasks[task.task]
+        if inspect.iscoroutinefunction(func):
+            raise TypeError(f"La tâche {task.task} est une coroutine, elle s'exécute avec `execute_task_async`")
+        self.store_output(task, func(self, task.args))
+
+    async def execute_task_async(self, task: SubTask) -> None:
+        """
+            Version asynchrone de `execute_task` : les tâches coroutines sont attendues directement, les tâches synchrones sont exécutées dans un thread.
+        """
+        func = self.tasks[task.task]
+        if inspect.iscoroutinefunction(func):
+            output = await func(self, task.args)
+        else:
+            output = await asyncio.to_thread(func, self, task.args)
+        self.store_output(task, output)
+
+    def store_output(self, task: SubTask, output) -> None:
         if task.out is not None and output is not None:
             self.outputs[task.out] = output
         pass
 
+    def event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+            Boucle asyncio partagée par les tâches coroutines lancées depuis `execute_tasks`, démarrée dans un thread au premier appel.
+        """
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="agent-asyncio", daemon=True).start()
+            return self.loop
+
     def get_inputs(self, name: str) -> dict:
         return self.outputs[name]
 
+    def build_dependencies(self, tasks: list[SubTask]) -> dict[int, set[int]]:
+        """
+            Construit le graphe de dépendances des sous-tâches à partir des références `in` / `dataviz` vers les sorties `out`.
+            Une sous-tâche ne dépend que des sous-tâches qui la précèdent dans le planning.
+
+            :return: Dictionnaire index de la sous-tâche -> index des sous-tâches dont elle dépend.
+        """
+        producers: dict[str, int] = {}
+        dependencies: dict[int, set[int]] = {}
+        for idx, task in enumerate(tasks):
+            args = task.args or {}
+            refs = {args[key] for key in DEPENDENCY_ARGS
+                    if isinstance(args.get(key), str)}
+            dependencies[idx] = {producers[ref]
+                                 for ref in refs if ref in producers}
+            if task.out is not None:
+                producers[task.out] = idx
+        return dependencies
+
     def execute_tasks(self, tasks: list[SubTask]):
-        for task in tasks:
-            self.execute_task(task)
-            yield task.description
+        """
+            Execute les sous-tâches en parallèle dès que leurs dépendances sont satisfaites.
+            Renvoie la description de chaque sous-tâche dans l'ordre de complétion.
+        """
+        dependencies = self.build_dependencies(tasks)
+        pending = dict(enumerate(tasks))
+        done: set[int] = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                # lancement des sous-tâches dont toutes les dépendances sont terminées
+                for idx in [i for i in pending if dependencies[i] <= done]:
+                    task = pending.pop(idx)
+                    if inspect.iscoroutinefunction(self.tasks[task.task]):
+                        # les tâches coroutines partagent une seule boucle plutôt qu'une boucle par thread du pool
+                        future = asyncio.run_coroutine_threadsafe(self.execute_task_async(task), self.event_loop())
+                    else:
+                        future = pool.submit(self.execute_task, task)
+                    running[future] = idx
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    idx = running.pop(future)
+                    # propage l'exception éventuelle de la sous-tâche
+                    future.result()
+                    done.add(idx)
+                    yield tasks[idx].description
+
+    async def execute_tasks_async(self, tasks: list[SubTask]) -> AsyncIterator[str]:
+        """
+            Version asynchrone de `execute_tasks` : les sous-tâches prêtes sont attendues en même temps sur la boucle asyncio courante.
+            Renvoie la description de chaque sous-tâche dans l'ordre de complétion.
+        """
+        dependencies = self.build_dependencies(tasks)
+        pending = dict(enumerate(tasks))
+        done: set[int] = set()
+        running: dict[asyncio.Task, int] = {}
+
+        try:
+            while pending or running:
+                for idx in [i for i in pending if dependencies[i] <= done]:
+                    running[asyncio.create_task(
+                        self.execute_task_async(pending.pop(idx)))] = idx
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    idx = running.pop(future)
+                    future.result()
+                    done.add(idx)
+                    yield tasks[idx].description
+        finally:
+            # annulation des sous-tâches restantes en cas d'erreur ou d'arrêt de l'itération
+            for future in running:
+                future.cancel()
 
     def reset(self):
         self.outputs = {}
+        if self.scrapper is not None:
+            self.scrapper.reset()
@@ -2,9 +2,18 @@ from pydantic import BaseModel, ValidationError, Field
 from typing import List, Dict, Optional, Any
 from ..utils.format import prompt_template, parse_json_response
 import json
+import re
 from ..utils.bedrock import WrapperBedrock, ConverseMessage
+from ..utils.cache import MemoryCache
+from ..utils.gazetteer import normalize_name
+from .templates import DOC_MAPPING, build_plan, normalize_niv_admin, select_examples
 import logging
 
+# plannings déjà construits, par requête normalisée
+PLAN_CACHE = MemoryCache(maxsize=256, ttl=24 * 3600)
+# modes de planification de `plan_actions`
+PLANNING_MODES = ("fast", "llm", "single")
+
 
 class SubTask(BaseModel):
     task: str = Field(..., description="Type de la tâche")
@@ -16,6 +25,92 @@ class SubTask(BaseModel):
         None, description="Nom de la variable pour la sortie de la sous-tâche")
 
 
+class SubTaskPlan(BaseModel):
+    """
+    Liste ordonnée des sous-tâches du planning.
+    """
+    tasks: List[SubTask] = Field(...,
+                                 description="Sous-tâches dans l'ordre d'exécution")
+
+
+class UserRequestValidation(BaseModel):
+    """
+    Résultat de la validation d'une requête utilisateur.
+    """
+    requete_valide: bool = Field(...,
+                                 description="La requête mentionne un risque environnemental et un lieu en France")
+    message: str = Field(...,
+                         description="Requête reformulée si elle est valide, sinon explication du problème")
+    risques: List[str] = Field(
+        [], description="Risques ou catégories de risques mentionnés")
+    lieux: List[str] = Field([], description="Lieux mentionnés")
+    niv_admin: Optional[str] = Field(
+        None, description="Niveau administratif des lieux (commune, département, région, groupement de communes)")
+
+
+class CombinedPlan(UserRequestValidation):
+    """
+    Validation de la requête utilisateur et planning de ses sous-tâches, obtenus en un seul appel.
+    """
+    tasks: List[SubTask] = Field(
+        [], description="Sous-tâches dans l'ordre d'exécution (vide si la requête n'est pas valide)")
+
+
+# exemples de validation de requêtes, partagés par la validation et le planning en un seul appel
+VALIDATION_EXAMPLES = [
+    {
+        "requete": "Quels sont les plans d'adaptation de la region Provence-Alpes-Côte d'Azur face aux vague de chaleur et ala sécheresse ?",
+        "requete_valide": "true",
+        "message": "Quels sont les plans d'adaptation de la région Provence-Alpes-Côte d'Azur face aux vagues de chaleur et à la sécheresse ?",
+        "risques": ["Vague de chaleur", "Sécheresse"],
+        "lieux": ["Provence-Alpes-Côte d'Azur"],
+        "niv_admin": "région"
+    },
+    {
+        "requete": "Comment la France gère-t-elle le stress hydrique ?",
+        "requete_valide": "false",
+        "message": "La requête mentionne un risque environnemental (stress hydrique), mais ne précise pas de localisation en France. Veuillez spécifier un lieu comme une commune, un département ou une région. Par exemple : 'Comment la région Occitanie gère-t-elle le stress hydrique ?'"
+    },
+    {
+        "requete": "Quels sont les projets d'urbanisation prévus à Lyon ?",
+        "requete_valide": "false",
+        "message": "La requête mentionne un lieu en France (Lyon, commune) mais ne fait référence à aucun risque environnemental. Veuillez inclure un risque environnemental pertinent. Par exemple : 'Quels sont les projets d'urbanisation prévus à Lyon pour faire face aux risques d'inondation ?'"
+    },
+    {
+        "requete": "Fais moi une synthèse des risques environnementaux à Paris.",
+        "requete_valide": "true",
+        "message": "Fais-moi une synthèse des risques environnementaux à Paris.",
+        "risques": [],
+        "lieux": ["Paris"],
+        "niv_admin": "commune"
+    },
+     {
+        "requete": "Rédige un rapport sur les risques dans la région de la Bretagne.",
+        "requete_valide": "true",
+        "message": "Rédige un rapport sur les risques dans la région de la Bretagne.",
+        "risques": [],
+        "lieux": ["Bretagne"],
+        "niv_admin": "région"
+    },
+    {
+        "requete": "Quelles sont les mesures prises contre les inondtaions à Paris, Bordeaux et Lyon ?",
+        "requete_valide": "true",
+        "message": "Quelles sont les mesures prises contre les inondations à Paris, Bordeaux et Lyon ?",
+        "risques": ["Inondation"],
+        "lieux": ["Paris", "Bordeaux", "Lyon"],
+        "niv_admin": "commune"
+    },
+    {
+        "requete": "Comment la métropole de Lyon s'adapte-t-elle à la pollution de l'air ?",
+        "requete_valide": "true",
+        "message": "Comment la métropole de Lyon s'adapte-t-elle à la pollution de l'air ?",
+        "risques": ["Pollution de l’air"],
+        "lieux": ["Métropole de Lyon"],
+        "niv_admin": "groupement de communes"
+    }
+]
+
+
 @prompt_template
 def validate_user_request_template(user_request: str, few_shot_examples: Optional[List[Dict[str, Any]]] = None) -> str:
     """
@@ -81,71 +176,29 @@ def validate_user_request_template(user_request: str, few_shot_examples: Optiona
 
 def validate_user_request(user_request: str,
                           client: WrapperBedrock,
-                          model_id: str) -> Dict[str, Any]:
+                          model_id: str,
+                          structured: bool = True) -> Dict[str, Any]:
     """
     Valide une requête utilisateur pour s'assurer qu'elle contient les informations nécessaires.
 
     :param prompt: Prompt pour guider le modèle lors de la correction.
     :param client: Instance de WrapperBedrock pour interagir avec le LLM.
     :param model_id: ID du modèle Bedrock à utiliser.
+    :param structured: Demande une réponse structurée (tool use), avec repli sur la réponse texte en cas d'échec.
 
     :return: Dictionnaire contenant les informations validées ou un message d'erreur.
     """
-    few_shot_examples = [
-        {
-            "requete": "Quels sont les plans d'adaptation de la region Provence-Alpes-Côte d'Azur face aux vague de chaleur et ala sécheresse ?",
-            "requete_valide": "true",
-            "message": "Quels sont les plans d'adaptation de la région Provence-Alpes-Côte d'Azur face aux vagues de chaleur et à la sécheresse ?",
-            "risques": ["Vague de chaleur", "Sécheresse"],
-            "lieux": ["Provence-Alpes-Côte d'Azur"],
-            "niv_admin": "région"
-        },
-        {
-            "requete": "Comment la France gère-t-elle le stress hydrique ?",
-            "requete_valide": "false",
-            "message": "La requête mentionne un risque environnemental (stress hydrique), mais ne précise pas de localisation en France. Veuillez spécifier un lieu comme une commune, un département ou une région. Par exemple : 'Comment la région Occitanie gère-t-elle le stress hydrique ?'"
-        },
-        {
-            "requete": "Quels sont les projets d'urbanisation prévus à Lyon ?",
-            "requete_valide": "false",
-            "message": "La requête mentionne un lieu en France (Lyon, commune) mais ne fait référence à aucun risque environnemental. Veuillez inclure un risque environnemental pertinent. Par exemple : 'Quels sont les projets d'urbanisation prévus à Lyon pour faire face aux risques d'inondation ?'"
-        },
-        {
-            "requete": "Fais moi une synthèse des risques environnementaux à Paris.",
-            "requete_valide": "true",
-            "message": "Fais-moi une synthèse des risques environnementaux à Paris.",
-            "risques": [],
-            "lieux": ["Paris"],
-            "niv_admin": "commune"
-        },
-         {
-            "requete": "Rédige un rapport sur les risques dans la région de la Bretagne.",
-            "requete_valide": "true",
-            "message": "Rédige un rapport sur les risques dans la région de la Bretagne.",
-            "risques": [],
-            "lieux": ["Bretagne"],
-            "niv_admin": "région"
-        },
-        {
-            "requete": "Quelles sont les mesures prises contre les inondtaions à Paris, Bordeaux et Lyon ?",
-            "requete_valide": "true",
-            "message": "Quelles sont les mesures prises contre les inondations à Paris, Bordeaux et Lyon ?",
-            "risques": ["Inondation"],
-            "lieux": ["Paris", "Bordeaux", "Lyon"],
-            "niv_admin": "commune"
-        },
-        {
-            "requete": "Comment la métropole de Lyon s'adapte-t-elle à la pollution de l'air ?",
-            "requete_valide": "true",
-            "message": "Comment la métropole de Lyon s'adapte-t-elle à la pollution de l'air ?",
-            "risques": ["Pollution de l’air"],
-            "lieux": ["Métropole de Lyon"],
-            "niv_admin": "groupement de communes"
-        }
-    ]
+    few_shot_examples = VALIDATION_EXAMPLES
     instruction = validate_user_request_template(
         user_request=user_request, few_shot_examples=few_shot_examples)
     messages = [ConverseMessage.make_user_message(instruction)]
+    if structured:
+        try:
+            return client.converse_structured(
+                model_id=model_id, messages=messages, output_model=UserRequestValidation, max_tokens=512).model_dump()
+        except Exception as e:
+            logging.warning(
+                f"Réponse structurée invalide pour la validation de la requête, repli sur la réponse texte : {e}")
     response = client.converse(
         model_id=model_id, messages=messages, max_tokens=512)
     response_text = response.content[0].text
@@ -160,7 +213,7 @@ def validate_user_request(user_request: str,
     except Exception:
         return {"requete_valide": False, "message": parsed_response["message"]}
 @prompt_template
-def subtask_prompt_template(user_request: str, few_shot_examples: Optional[List[Dict[str, Any]]] = None) -> str:
+def subtask_prompt_template(user_request: str, few_shot_examples: Optional[List[Dict[str, Any]]] = None, doc_mapping: Dict[str, Any] = DOC_MAPPING) -> str:
     """
     Vous êtes un planificateur de tâches avancé au sein de SFIL, une banque d'investissement spécialisée dans la recherche et l'analyse des documents relatifs à l'adaptation des collectivités aux risques climatiques. Votre tâche consiste à analyser la requête utilisateur et à diviser le processus en sous-tâches clairement définies. Ces sous-tâches doivent être organisées en fonction de l'ordre d'exécution et des dépendances. Elles doivent couvrir les étapes suivantes, qui sont génériques et peuvent varier légèrement selon le cas spécifique :
 
@@ -183,26 +236,6 @@ def subtask_prompt_template(user_request: str, few_shot_examples: Optional[List[
 
     Chaque valeur d'attribut doit être encadrée de guillemets doubles. Très important pour le parser JSON.
 
-
-    {%- set doc_mapping = {
-        "commune": {
-            "docs": ["DICRIM", "Plan Local d'Urbanisme", "Plan Communal de Sauvegarde"],
-            "sources": ["Geoportail", "Georisques", "Gaspar"]
-        },
-        "groupement": {
-            "docs": ["Plan Local d'Urbanisme Intercommunal", "Plan Intercommunal De Sauvegarde", "Plan d'Action de Prévention des Inondations"],
-            "sources": ["Geoportail Urbanisme", "Gaspar", "Ademe"]
-        },
-        "departement": {
-            "docs": ["Dossier départemental des risques majeurs", "Plan Départemental de Protection des Forêts Contre les Incendies"],
-            "sources": ["Gaspar", "Préfecture"]
-        },
-        "région": {
-            "docs": ["SRADDET", "SDAGE"],
-            "sources": ["Ademe", "Régions de France"]
-        }
-    } %}
-
     [
         {
             "task": "SEARCH_DOCS",
@@ -265,7 +298,8 @@ def subtask_prompt_template(user_request: str, few_shot_examples: Optional[List[
 def divide_task(prompt: str,
                 client: WrapperBedrock,
                 model_id: str,
-                max_retries: int) -> Optional[List[SubTask]]:
+                max_retries: int,
+                structured: bool = True) -> Optional[List[SubTask]]:
     """
     Logique pour valider les sous-tâches générées par le modèle Bedrock.
     Si une erreur est détectée, guide le modèle pour qu'il se corrige et relance la demande.
@@ -274,11 +308,20 @@ def divide_task(prompt: str,
     :param client: Instance de WrapperBedrock pour interagir avec le LLM.
     :param model_id: ID du modèle Bedrock à utiliser.
     :param max_retries: Nombre maximum
+    :param structured: Demande une réponse structurée (tool use) validée par le schéma des sous-tâches,
+        les tentatives en texte libre ne servant que de repli.
 
     :return: Liste de sous-tâches validées ou une la tàche initiale si l'échec persiste.
     """
     attempt = 0
     messages = [ConverseMessage.make_system_message(prompt)]
+    if structured:
+        try:
+            return client.converse_structured(
+                model_id, messages=messages, output_model=SubTaskPlan, max_tokens=1024).tasks
+        except Exception as e:
+            logging.warning(
+                f"Réponse structurée invalide pour le planning, repli sur la réponse texte : {e}")
     while attempt < max_retries:
         try:
             llm_response = client.converse(
@@ -323,6 +366,8 @@ def plan_actions(
     user_request: str,
     few_shot_examples: Optional[List[Dict[str, Any]]] = None,
     max_retries: int = 3,
+    mode: str = "fast",
+    use_cache: bool = True,
 ) -> List[SubTask]:
     """
     Divise une tâche utilisateur en sous-tâches cohérentes en utilisant WrapperBedrock.
@@ -334,15 +379,78 @@ def plan_actions(
     :param user_request: Requête utilisateur à diviser en sous-tâches.
     :param few_shot_examples: Exemples pour le Few-Shot Prompting (optionnel).
     :param max_retries: Nombre maximum de tentatives en cas d'erreur.
+    :param mode: "fast" pour construire le planning canonique à partir de la validation sans appel au LLM
+        (le LLM n'est sollicité que pour les requêtes inhabituelles), "llm" pour toujours le solliciter,
+        "single" pour valider et planifier en un seul appel au LLM (`planning_model_id`).
+    :param use_cache: Réutilise le planning d'une requête identique (après normalisation).
     :param kwargs: Arguments supplémentaires à transmettre au modèle.
 
     :return: Liste de sous-tâches validées ou une la tàche initiale si l'échec persiste.
     """
-    # Vérification de la requête utilisateur
-    output = validate_user_request(user_request, client, validation_model_id)
+    if mode not in PLANNING_MODES:
+        raise ValueError(f"Mode de planification invalide : {mode}, attendu : {', '.join(PLANNING_MODES)}")
+    cache_key = PLAN_CACHE.make_key(mode, normalize_request(user_request))
+    cached = PLAN_CACHE.get(cache_key) if use_cache else None
+    if cached is not None:
+        print("Planning réutilisé depuis le cache")
+        return {"tasks": [SubTask.model_validate(task) for task in cached]}
+
+    combined = plan_single_call(client, planning_model_id, user_request) if mode == "single" else None
+    if combined is not None:
+        output = combined.model_dump(exclude={"tasks"})
+    else:
+        # Vérification de la requête utilisateur
+        output = validate_user_request(user_request, client, validation_model_id)
     if not output['requete_valide']:
         return {"error": output["message"]}
 
+    # build_plan normalise lui-même le niveau administratif et renvoie None s'il est inconnu
+    tasks = build_plan(output) if mode in ("fast", "single") else None
+    if combined is not None and combined.tasks:
+        subtasks = combined.tasks
+    elif tasks is not None:
+        print("Planning construit sans appel au LLM")
+        subtasks = [SubTask.model_validate(task) for task in tasks]
+    else:
+        subtasks = plan_with_llm(client, planning_model_id, output, few_shot_examples, max_retries)
+
+    if use_cache and subtasks:
+        PLAN_CACHE.set(cache_key, [task.model_dump() for task in subtasks])
+    return {"tasks": subtasks}
+
+
+def normalize_request(user_request: str) -> str:
+    """
+    Normalise une requête pour le cache des plannings : minuscules, sans accents ni ponctuation.
+    """
+    return " ".join(re.findall(r"\w+", normalize_name(user_request)))
+
+
+def plan_with_llm(
+    client: WrapperBedrock,
+    planning_model_id: str,
+    output: Dict[str, Any],
+    few_shot_examples: Optional[List[Dict[str, Any]]] = None,
+    max_retries: int = 3,
+) -> List[SubTask]:
+    """
+    Divise une requête validée en sous-tâches avec le LLM.
+
+    :param client: Instance de WrapperBedrock pour interagir avec le LLM.
+    :param planning_model_id: ID du modèle Bedrock pour la division de la tâche en sous-tâches.
+    :param output: Requête validée par `validate_user_request`.
+    :param few_shot_examples: Exemples pour le Few-Shot Prompting (exemples par défaut si None).
+    :param max_retries: Nombre maximum de tentatives en cas d'erreur.
+
+    :return: Liste de sous-tâches validées.
+    """
+    # le template indexe DOC_MAPPING par niveau administratif : un niveau inconnu est traité comme une commune
+    output = {**output, "niv_admin": normalize_niv_admin(output.get("niv_admin")) or "commune"}
+    if few_shot_examples is not None:
+        subtask_prompt = subtask_prompt_template(
+            user_request=output, few_shot_examples=few_shot_examples)
+        return divide_task(subtask_prompt, client, planning_model_id, max_retries)
+
     # Génération du prompt initial
     few_shot_examples = [
         {
@@ -554,7 +662,73 @@ def plan_actions(
         user_request=output, few_shot_examples=few_shot_examples)
 
     # Validation de la réponse
-    subtasks = divide_task(subtask_prompt, client,
-                           planning_model_id, max_retries)
+    return divide_task(subtask_prompt, client,
+                       planning_model_id, max_retries)
+
+
+@prompt_template
+def combined_plan_template(user_request: str, examples: List[Dict[str, Any]], doc_mapping: str = json.dumps(DOC_MAPPING, ensure_ascii=False)) -> str:
+    """
+    Vous êtes le planificateur de SFIL, une banque d'investissement qui analyse l'adaptation des collectivités françaises aux risques climatiques.
+
+    1. Vérifiez que la requête porte sur un ou plusieurs risques environnementaux (physiques aigus, physiques chroniques ou environnementaux) et mentionne un lieu en France.
+    Si un critère manque, la requête n'est pas valide : expliquez ce qui manque dans "message" avec un exemple de requête valide, et ne renvoyez aucune sous-tâche.
+    2. Si la requête est valide, corrigez-la dans "message", extrayez les "risques", les "lieux" et le niveau administratif "niv_admin" (commune, groupement de communes, département, région).
+    3. Divisez alors la requête en sous-tâches parmi SEARCH_DOCS, ANALYZE_DOCS, DATAVIZ et SYNTHESIZE, reliées par leurs sorties ("in", "dataviz").
+    Les documents à rechercher selon le niveau administratif sont : {{ doc_mapping }}
+
+    Exemples :
+    {% for example in examples %}
+    Requête utilisateur : {{ example["requete"] }}
+    Résultat : {{ example["resultat"] }}
+    {% endfor %}
+
+    Retournez UNIQUEMENT un JSON de la même forme que les exemples.
+
+    **Requête utilisateur :** {{ user_request }}
+    """
+    pass
 
-    return {"tasks": subtasks}
\ No newline at end of file
+
+def combined_examples(examples: List[Dict[str, Any]] = VALIDATION_EXAMPLES) -> List[Dict[str, Any]]:
+    """
+    Exemples du planning en un seul appel, dérivés des exemples de validation : les sous-tâches des requêtes
+    valides sont celles du planning canonique. Les requêtes valides hors du cas canonique sont écartées.
+    Le résultat attendu de chaque exemple est sérialisé en JSON (accents non échappés).
+    """
+    out = []
+    for example in examples:
+        valid = str(example["requete_valide"]).lower() == "true"
+        resultat = {"requete_valide": valid, "message": example["message"]}
+        if valid:
+            validation = {**example, "niv_admin": normalize_niv_admin(example.get("niv_admin"))}
+            tasks = build_plan(validation)
+            if tasks is None:
+                continue
+            resultat.update(risques=example["risques"], lieux=example["lieux"],
+                            niv_admin=example["niv_admin"], tasks=tasks)
+        out.append({"requete": example["requete"], "requete_valide": example["requete_valide"],
+                    "resultat": json.dumps(resultat, ensure_ascii=False)})
+    return out
+
+
+def plan_single_call(client: WrapperBedrock, model_id: str, user_request: str, k: int = 3) -> Optional[CombinedPlan]:
+    """
+    Valide et planifie une requête utilisateur en un seul appel au LLM, avec les `k` exemples les plus proches.
+
+    :param client: Instance de WrapperBedrock pour interagir avec le LLM.
+    :param model_id: ID du modèle Bedrock à utiliser.
+    :param user_request: Requête utilisateur.
+    :param k: Nombre d'exemples few-shot.
+
+    :return: Validation et sous-tâches, ou None si la réponse est invalide (le planning en deux appels prend le relais).
+    """
+    examples = select_examples(user_request, combined_examples(), k)
+    messages = [ConverseMessage.make_user_message(
+        combined_plan_template(user_request, examples))]
+    try:
+        return client.converse_structured(model_id, messages=messages, output_model=CombinedPlan, max_tokens=1536)
+    except Exception as e:
+        logging.warning(
+            f"Planning en un seul appel invalide, repli sur la validation puis le planning : {e}")
+        return None
@@ -2,25 +2,83 @@ import fitz
 import folium.plugins
 from ..utils.bedrock import ConverseMessage
 from .executor import agent_task, AgentContext
-from ..analysis import analyze_doc_risks, RiskAnalysisOutput
-from ..utils.scrapper import scrapper
+from ..analysis import analyze_doc_risks, analyze_doc_risks_map_reduce, RiskAnalysisOutput, RISQUES
+from ..retrieval import select_relevant_chunks
+from ..utils.scrapper import scrapper, GEORISQUES_REPORT
+from ..utils.pdf_cache import get_pdf_cache
+from ..utils.catnat import CatnatStore
 from ..dataviz import generate_visualization, recommend_dataviz_suggestion, slotfill_viz
 import folium as folium
 import plotly.express as px
 import os
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+# nombre d'analyses de documents envoyées en parallèle à Bedrock
+ANALYSIS_MAX_WORKERS = 4
+# nombre de passages de chaque document envoyés à l'analyse
+ANALYSIS_TOP_K_CHUNKS = 12
+# mode d'analyse par défaut : "retrieval" (passages les plus proches des risques) ou "map_reduce" (document complet par morceaux),
+# remplacé par la variable d'environnement ANALYSIS_MODE ou l'argument "mode" de la sous-tâche
+ANALYSIS_MODE = "retrieval"
+ANALYSIS_MODES = ("retrieval", "map_reduce")
+ANALYSIS_MODEL_ID = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+_SCRAPPER_LOCK = threading.Lock()
+
+
+def get_scrapper(exec: AgentContext) -> scrapper:
+    """
+    Scrapper partagé par les tâches d'un contexte, créé au premier appel.
+    """
+    with _SCRAPPER_LOCK:
+        if exec.scrapper is None:
+            exec.scrapper = scrapper(num_results=1, pipe="mistral.mistral-7b-instruct-v0:2",
+                                     googlecred=os.environ["SCRAPPER_API"], googleidengin=os.environ["SCRAPPER_ENGINE"], pdf_cache=get_pdf_cache(),
+                                     # base CATNAT locale (voir `python -m app.utils.catnat`)
+                                     catnat_store=CatnatStore(os.environ["CATNAT_DB"]) if "CATNAT_DB" in os.environ else None,
+                                     bedrockapi=exec.bedrock)
+        return exec.scrapper
 
 
 @agent_task("SEARCH_DOCS")
 def search_docs(exec: AgentContext, args: dict) -> dict:
-    sc = scrapper(num_results=1, pipe="mistral.mistral-7b-instruct-v0:2",
-                  googlecred=os.environ["SCRAPPER_API"], googleidengin=os.environ["SCRAPPER_ENGINE"])
-    print("begin search georisques")
-    geo_result = sc.repport_geoRisk(city=args["lieux"].split(",")[0])
-    print("begin search docs")
-    docs_results = sc.find_doc(args["lieux"].split(",")[0], args["docs"])
-    if geo_result:
-        docs_results.append(geo_result)
-    return docs_results
+    sc = get_scrapper(exec)
+    lieu = args["lieux"].split(",")[0]
+
+    docs = list(args["docs"])
+    risques = args.get("risques")
+    insee = None
+    indexed = []
+    found_types = set()
+    if exec.index is not None:
+        insee = sc.get_insee_code(lieu)
+        # les codes INSEE font 5 caractères, sinon get_insee_code a renvoyé un message d'erreur
+        insee = insee if len(insee) == 5 else None
+        indexed = exec.index.documents_for(insee, docs + [GEORISQUES_REPORT]) if insee else []
+        found_types = {doc["doc"] for doc in indexed}
+        if indexed:
+            print(f"{len(indexed)} documents déjà indexés pour {lieu}")
+        # seuls les types de documents absents de l'index sont recherchés
+        docs = [doc for doc in docs if doc not in found_types]
+        if not docs and GEORISQUES_REPORT in found_types:
+            return indexed
+
+    docs_results = []
+    if GEORISQUES_REPORT not in found_types:
+        print("begin search georisques")
+        geo_result = sc.repport_geoRisk(city=lieu)
+        if geo_result:
+            docs_results.append(geo_result)
+    if docs:
+        print("begin search docs")
+        docs_results = sc.find_doc(lieu, docs, keywords=risques if isinstance(risques, list) else None) + docs_results
+
+    if exec.index is not None:
+        for doc in docs_results:
+            doc["insee"] = insee
+            exec.index.add_document(doc["url"], insee, doc["pdf"], doc["doc"])
+    return indexed + docs_results
 
 
 @agent_task("ANALYZE_DOCS")
@@ -29,15 +87,55 @@ def analyze_documents(exec: AgentContext, args: dict) -> list:
         return {}
     else:
         files = exec.get_inputs(args["in"])
-        analysis = []
-        for f in files:
-            if len(f["pdf"]) > 200000:
-                f["pdf"] = f["pdf"][:200000]
+
+        risques = args.get("risques", None)
+        # le planificateur peut renvoyer une liste vide (ou "[]") pour tous les risques
+        search_risks = risques if isinstance(
+            risques, list) and risques else RISQUES
+
+        mode = args.get("mode") or os.environ.get("ANALYSIS_MODE", ANALYSIS_MODE)
+        if mode not in ANALYSIS_MODES:
+            raise ValueError(f"Mode d'analyse invalide : {mode}, attendu : {', '.join(ANALYSIS_MODES)}")
+
+        def select_doc(f: dict) -> str:
+            try:
+                # seuls les passages les plus proches des risques demandés sont envoyés au modèle
+                doc = select_relevant_chunks(
+                    exec.bedrock, f["pdf"], search_risks, top_k=ANALYSIS_TOP_K_CHUNKS, index=exec.index, url=f["url"])
+            except Exception as e:
                 print(
-                    f"Le fichier {f['url']} est trop grand, il a été tronqué à 200000 caractères")
+                    f"Echec de la sélection des passages de {f['url']} ({e}), le document est tronqué à 200000 caractères")
+                doc = f["pdf"][:200000]
             print("Analyse de ", f["url"])
-            analysis.append(analyze_doc_risks(
-                exec.bedrock, f["pdf"], f["url"], "anthropic.claude-3-5-sonnet-20241022-v2:0", args.get("risques", None)))
+            return doc
+
+        def analyze(f: dict) -> RiskAnalysisOutput | None:
+            if exec.index is not None:
+                indexed = exec.index.get_analysis(f["url"], search_risks)
+                if indexed is not None:
+                    print("Analyse déjà indexée pour ", f["url"])
+                    return RiskAnalysisOutput.model_validate(indexed)
+            try:
+                if mode == "map_reduce":
+                    print("Analyse map-reduce de ", f["url"])
+                    analysis = analyze_doc_risks_map_reduce(
+                        exec.bedrock, f["pdf"], f["url"], ANALYSIS_MODEL_ID, risques)
+                else:
+                    analysis = analyze_doc_risks(
+                        exec.bedrock, select_doc(f), f["url"], ANALYSIS_MODEL_ID, risques)
+                if exec.index is not None:
+                    exec.index.add_analysis(
+                        f["url"], search_risks, analysis.model_dump())
+                return analysis
+            except Exception as e:
+                # un document en échec ne fait pas échouer tout le lot
+                print(f"Echec de l'analyse de {f['url']} : {e}")
+                return None
+
+        max_workers = args.get("max_workers", ANALYSIS_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files) or 1))) as pool:
+            # map conserve l'ordre des documents en entrée
+            analysis = [a for a in pool.map(analyze, files) if a is not None]
 
     return analysis
 
@@ -49,7 +147,7 @@ def dataviz(exec: AgentContext, args: dict) -> dict:
     lieu = args.get("lieux", "").split(",")[0]
     analyzed_risks = exec.get_inputs(args["in"])
 
-    sc = scrapper()
+    sc = get_scrapper(exec)
 
     # recuperation de la suggestion de dataviz
     source = recommend_dataviz_suggestion(
@@ -124,10 +222,14 @@ def dataviz(exec: AgentContext, args: dict) -> dict:
 
 
 @agent_task("SYNTHESIZE")
-def synth(exec: AgentContext, args: dict) -> dict:
+def synth(exec: AgentContext, args: dict) -> str | Iterator[str]:
     data = [d.model_dump_json() for d in exec.get_inputs(args["in"])]
 
     test_prompt = f"Fais une synthèse globale des risques à partir des données de risques qui sont au format JSON: \n {data}. Pour chaque risque identifié, nomme le risque, et le plan de mitigation si il y'en a un, et la source du risque."
+    if exec.stream:
+        # le texte est généré au fur et à mesure de la lecture de l'itérateur
+        return exec.bedrock.converse_stream(model_id="mistral.mistral-large-2407-v1:0",
+                                            messages=[ConverseMessage.make_user_message(test_prompt)], max_tokens=4096)
     c = exec.bedrock.converse(model_id="mistral.mistral-large-2407-v1:0",
                               messages=[ConverseMessage.make_user_message(test_prompt)], max_tokens=4096)
     return c.content[0].text
@@ -0,0 +1,143 @@
+import re
+from typing import Any, Dict, List, Optional
+from ..utils.gazetteer import normalize_name
+from ..utils.relevance import FRENCH_COMMON_WORDS
+
+# documents et sources à rechercher selon le niveau administratif du lieu
+DOC_MAPPING = {
+    "commune": {
+        "docs": ["DICRIM", "Plan Local d'Urbanisme", "Plan Communal de Sauvegarde"],
+        "sources": ["Geoportail", "Georisques", "Gaspar"]
+    },
+    "groupement": {
+        "docs": ["Plan Local d'Urbanisme Intercommunal", "Plan Intercommunal De Sauvegarde", "Plan d'Action de Prévention des Inondations"],
+        "sources": ["Geoportail Urbanisme", "Gaspar", "Ademe"]
+    },
+    "departement": {
+        "docs": ["Dossier départemental des risques majeurs", "Plan Départemental de Protection des Forêts Contre les Incendies"],
+        "sources": ["Gaspar", "Préfecture"]
+    },
+    "région": {
+        "docs": ["SRADDET", "SDAGE"],
+        "sources": ["Ademe", "Régions de France"]
+    }
+}
+
+# l'historique CATNAT de DATAVIZ est tiré des communes, il n'est pas produit à l'échelle d'une région
+DATAVIZ_LEVELS = ("commune", "groupement", "departement")
+
+
+def normalize_niv_admin(niv_admin: str | None) -> str | None:
+    """
+    Ramène le niveau administratif renvoyé par la validation ("groupement de communes", "département", "Région"...)
+    à une clé de `DOC_MAPPING`, None s'il n'est pas reconnu.
+    """
+    if not niv_admin:
+        return None
+    niv = normalize_name(niv_admin)
+    if any(word in niv for word in ("groupement", "intercommunal", "metropole", "communaute", "epci")):
+        return "groupement"
+    if "departement" in niv:
+        return "departement"
+    if "region" in niv:
+        return "région"
+    if "commune" in niv or "ville" in niv:
+        return "commune"
+    return None
+
+
+def build_plan(validation: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Construit sans appel au LLM le planning canonique SEARCH_DOCS -> ANALYZE_DOCS -> DATAVIZ -> SYNTHESIZE
+    à partir de la requête validée.
+
+    :param validation: Résultat de `validate_user_request` ({"message", "risques", "lieux", "niv_admin"}).
+
+    :return: Sous-tâches (dictionnaires au format de SubTask), ou None si la requête sort du cas canonique
+        (plusieurs lieux, niveau administratif inconnu) et doit être planifiée par le LLM.
+    """
+    niv_admin = normalize_niv_admin(validation.get("niv_admin"))
+    lieux = validation.get("lieux") or []
+    if niv_admin is None or len(lieux) != 1:
+        return None
+
+    lieu = lieux[0]
+    risques = validation.get("risques") or []
+    sujet = ", ".join(risques) if risques else "les risques environnementaux"
+    tasks = [
+        {
+            "task": "SEARCH_DOCS",
+            "description": f"Recherche de documents sur {sujet} pour {lieu}",
+            "args": {
+                "docs": DOC_MAPPING[niv_admin]["docs"],
+                "sources": DOC_MAPPING[niv_admin]["sources"],
+                "lieux": lieu,
+                "risques": risques
+            },
+            "out": "search_output"
+        },
+        {
+            "task": "ANALYZE_DOCS",
+            "description": f"Analyse des documents sur {sujet} pour {lieu}",
+            "args": {
+                "in": "search_output",
+                "risques": risques
+            },
+            "out": "analyze_output"
+        }
+    ]
+    synthesize_args = {"in": "analyze_output"}
+    if niv_admin in DATAVIZ_LEVELS:
+        tasks.append({
+            "task": "DATAVIZ",
+            "description": f"Création de visualisations sur {sujet} pour {lieu}",
+            "args": {
+                "in": "analyze_output",
+                "risques": risques,
+                "lieux": lieu
+            },
+            "out": "dataviz_output"
+        })
+        synthesize_args["dataviz"] = "dataviz_output"
+    tasks.append({
+        "task": "SYNTHESIZE",
+        "description": f"Synthèse et recommandations sur {sujet} pour {lieu}",
+        "args": synthesize_args,
+        "out": "synthesize_output"
+    })
+    return tasks
+
+
+def request_words(text: str) -> set[str]:
+    """
+    Mots significatifs d'une requête (normalisés, sans les mots outils ni les mots de moins de 3 lettres).
+    """
+    return {word for word in re.findall(r"\w+", normalize_name(text))
+            if len(word) > 2 and word not in FRENCH_COMMON_WORDS}
+
+
+def select_examples(user_request: str, examples: List[Dict[str, Any]], k: int = 3) -> List[Dict[str, Any]]:
+    """
+    Sélectionne les `k` exemples few-shot dont la requête est la plus proche de `user_request`
+    (indice de Jaccard sur les mots), en gardant au moins un exemple de chaque verdict de validation.
+
+    :param examples: Exemples ({"requete", "requete_valide", ...}).
+
+    :return: Exemples retenus, du plus proche au moins proche.
+    """
+    words = request_words(user_request)
+
+    def similarity(example: Dict[str, Any]) -> float:
+        other = request_words(example["requete"])
+        return len(words & other) / len(words | other) if words | other else 0.0
+
+    ranked = sorted(examples, key=similarity, reverse=True)
+    selected = ranked[:k]
+    verdicts = {str(example["requete_valide"]).lower() for example in selected}
+    if len(verdicts) == 1 and k > 1:
+        # un exemple du verdict opposé, pour que le modèle voie les deux formes de réponse
+        opposite = next((example for example in ranked[k:]
+                         if str(example["requete_valide"]).lower() not in verdicts), None)
+        if opposite is not None:
+            selected[-1] = opposite
+    return selected
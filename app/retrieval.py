@@ -0,0 +1,132 @@
+from app.utils.bedrock import WrapperBedrock, cosine_similarity
+from app.utils.vector_index import VectorIndex
+from app.utils.pdf import CHARS_PER_TOKEN
+import numpy as np
+import re
+
+PAGE_MARKER = re.compile(r"\[page (\d+)\]")
+
+
+def chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> list[str]:
+    """
+    Découpe un texte en morceaux d'environ `chunk_size` caractères, en coupant de préférence sur un saut de ligne.
+
+    Args:
+        text (str): Texte à découper.
+        chunk_size (int, optional): Taille maximale d'un morceau en caractères. Defaults to 2000.
+        overlap (int, optional): Nombre de caractères partagés entre deux morceaux consécutifs. Defaults to 200.
+
+    Returns:
+        list[str]: Morceaux du texte, dans l'ordre du document.
+    """
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # coupe sur le dernier saut de ligne de la seconde moitié du morceau s'il y en a un
+            cut = text.rfind("\n", start + chunk_size // 2, end)
+            if cut != -1:
+                end = cut
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def chunk_tokens(text: str, max_tokens: int = 6000, overlap_tokens: int = 200) -> list[str]:
+    """
+    Découpe un texte en morceaux d'au plus `max_tokens` tokens (estimés à partir du nombre de caractères).
+
+    Chaque morceau commence par le marqueur `[page N]` de la page où il débute, pour que les citations restent possibles.
+
+    Args:
+        text (str): Texte à découper, avec ses marqueurs de page.
+        max_tokens (int, optional): Nombre maximal de tokens d'un morceau. Defaults to 6000.
+        overlap_tokens (int, optional): Nombre de tokens partagés entre deux morceaux consécutifs. Defaults to 200.
+
+    Returns:
+        list[str]: Morceaux du texte, dans l'ordre du document.
+    """
+    marker_size = len("[page 00000]\n")
+    chunks = chunk_text(text, max_tokens * CHARS_PER_TOKEN - marker_size,
+                        overlap_tokens * CHARS_PER_TOKEN)
+    return add_page_markers(text, chunks)
+
+
+def add_page_markers(text: str, chunks: list[str]) -> list[str]:
+    """
+    Préfixe chaque morceau du texte par le marqueur `[page N]` de la page où il débute, s'il n'en commence pas déjà par un.
+
+    Args:
+        text (str): Texte d'origine, avec ses marqueurs de page.
+        chunks (list[str]): Morceaux du texte, dans l'ordre du document.
+
+    Returns:
+        list[str]: Morceaux précédés de leur marqueur de page.
+    """
+    markers = [(m.start(), m.group(0)) for m in PAGE_MARKER.finditer(text)]
+    out = []
+    position = 0
+    for chunk in chunks:
+        found = text.find(chunk, position)
+        # un morceau absent du texte (index construit sur une autre version du document) est laissé tel quel
+        if found != -1:
+            position = found + 1
+            if not chunk.startswith("[page "):
+                previous = [marker for start, marker in markers if start < found]
+                if previous:
+                    chunk = f"{previous[-1]}\n{chunk}"
+        out.append(chunk)
+    return out
+
+
+def select_relevant_chunks(
+        bedrock: WrapperBedrock,
+        doc: str,
+        risques: list[str],
+        top_k: int = 12,
+        chunk_size: int = 2000,
+        max_chunks: int = 2000,
+        index: VectorIndex | None = None,
+        url: str | None = None
+    ) -> str:
+    """
+    Sélectionne les passages d'un document les plus proches des risques demandés, par similarité d'embeddings.
+
+    Args:
+        bedrock (WrapperBedrock): Instance Bedrock pour le calcul des embeddings.
+        doc (str): Contenu du document.
+        risques (list[str]): Risques à rechercher dans le document.
+        top_k (int, optional): Nombre de passages conservés. Defaults to 12.
+        chunk_size (int, optional): Taille d'un passage en caractères. Defaults to 2000.
+        max_chunks (int, optional): Nombre maximal de passages encodés par document. Defaults to 2000.
+        index (VectorIndex, optional): Index local où réutiliser et stocker les embeddings des passages. Defaults to None.
+        url (str, optional): URL du document, clé dans l'index. Defaults to None.
+
+    Returns:
+        str: Passages retenus, dans l'ordre du document, chacun précédé du marqueur de sa page.
+    """
+    stored = index.get_chunks(url) if index is not None and url else None
+    if stored is not None:
+        chunks, chunk_embeddings = stored
+    else:
+        chunks = chunk_text(doc, chunk_size)[:max_chunks]
+    if len(chunks) <= top_k:
+        return "\n[...]\n".join(add_page_markers(doc, chunks))
+
+    if stored is None:
+        chunk_embeddings = bedrock.get_embeddings(chunks)
+        if index is not None and url:
+            index.add_chunks(url, chunks, chunk_embeddings)
+    risk_embeddings = bedrock.get_embeddings(
+        [f"Risque {r} : identification du risque et plan d'adaptation" for r in risques])
+
+    # score d'un passage = meilleure similarité avec l'un des risques
+    scores = cosine_similarity(risk_embeddings, chunk_embeddings).max(axis=0)
+    best = np.sort(np.argsort(scores)[::-1][:top_k])
+    # les marqueurs sont ajoutés après le calcul des embeddings, pour que seuls les passages soient comparés aux risques
+    return "\n[...]\n".join(add_page_markers(doc, [chunks[i] for i in best]))
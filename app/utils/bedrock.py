@@ -1,8 +1,13 @@
+import asyncio
 import boto3
 import json
 import numpy as np
 from pydantic import BaseModel
-from typing import Literal, List
+from typing import Literal, List, Iterator
+from .cache import ResponseCache, MemoryCache
+from .ratelimit import TokenBucket
+from .format import parse_json_response
+from concurrent.futures import ThreadPoolExecutor
 
 
 class ConverseMessageContent(BaseModel):
@@ -32,38 +37,128 @@ class ConverseMessage(BaseModel):
         return cls(role="user", content=[ConverseMessageContent(text=message)])
 
 
+def cosine_similarity(queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """
+    Similarité cosinus entre chaque requête et chaque ligne d'une matrice d'embeddings.
+
+    :param queries: Embedding (dimension,) ou matrice (n, dimension) de requêtes.
+    :param matrix: Matrice (m, dimension) d'embeddings.
+
+    :return: Matrice (n, m) des similarités (vecteur (m,) pour une seule requête).
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    q = queries / np.maximum(np.linalg.norm(queries, axis=-1, keepdims=True), 1e-12)
+    m = matrix / np.maximum(np.linalg.norm(matrix, axis=-1, keepdims=True), 1e-12)
+    return q @ m.T
+
+
+def _inline_refs(schema, defs: dict):
+    if isinstance(schema, dict):
+        if "$ref" in schema:
+            return _inline_refs(defs[schema["$ref"].split("/")[-1]], defs)
+        return {k: _inline_refs(v, defs) for k, v in schema.items() if k != "$defs"}
+    if isinstance(schema, list):
+        return [_inline_refs(v, defs) for v in schema]
+    return schema
+
+
+def tool_config_for(model: type[BaseModel], name: str | None = None, description: str | None = None) -> dict:
+    """
+    Configuration d'outil (`toolConfig`) de l'API Converse forçant une réponse conforme au schéma d'un modèle pydantic.
+
+    :param model: Modèle pydantic de la réponse attendue (un objet JSON).
+    :param name: Nom de l'outil (nom du modèle par défaut).
+    :param description: Description de l'outil (docstring du modèle par défaut).
+
+    :return: Configuration à passer à `converse_raw(tool_config=...)`.
+    """
+    schema = model.model_json_schema()
+    # les définitions imbriquées sont développées, tous les modèles ne résolvant pas les $ref
+    schema = _inline_refs(schema, schema.get("$defs", {}))
+    return {
+        "tools": [{
+            "toolSpec": {
+                "name": name or model.__name__,
+                "description": description or (model.__doc__ or model.__name__).strip(),
+                "inputSchema": {"json": schema}
+            }
+        }],
+        # un seul outil : "any" force son utilisation (le choix d'un outil nommé n'est pas supporté par tous les modèles)
+        "toolChoice": {"any": {}}
+    }
+
+
+def structured_output_text(response: dict) -> str:
+    """
+    Texte JSON d'une réponse de `converse_raw(tool_config=...)` : l'entrée de l'outil si le modèle l'a utilisé,
+    le texte de la réponse sinon.
+
+    Permet de récupérer le début d'une réponse structurée coupée par la limite de tokens (stopReason "max_tokens").
+    """
+    content = response["output"]["message"]["content"]
+    for block in content:
+        if "toolUse" in block:
+            tool_input = block["toolUse"]["input"]
+            # une entrée coupée peut être renvoyée telle quelle, sous forme de texte
+            return tool_input if isinstance(tool_input, str) else json.dumps(tool_input, ensure_ascii=False)
+    return "".join(block.get("text", "") for block in content)
+
+
+# raisons d'arrêt d'une réponse complète : les réponses coupées (max_tokens) ou filtrées ne sont pas mises en cache
+CACHEABLE_STOP_REASONS = ("end_turn", "tool_use")
+
+
+def is_cacheable_response(response: dict) -> bool:
+    """
+    Indique si une réponse Converse peut être mise en cache : réponse complète et non vide.
+    """
+    if response.get("stopReason") not in CACHEABLE_STOP_REASONS:
+        return False
+    content = response.get("output", {}).get("message", {}).get("content") or []
+    return any("toolUse" in block or block.get("text", "").strip() for block in content)
+
+
 class WrapperBedrock:
-    def __init__(self, service_name='bedrock-runtime', region: str = "us-west-2"):
+    def __init__(self, service_name='bedrock-runtime', region: str = "us-west-2", cache: ResponseCache | None = None,
+                 embedding_cache: ResponseCache | None = None, rate_limiter: TokenBucket | None = None,
+                 embedding_rate_limiter: TokenBucket | None = None):
         """
         Wrapper pour les APIs Bedrock.
 
         :param service_name: Nom du service Bedrock.
         :param region: Région AWS.
+        :param cache: Cache optionnel des réponses de `converse`, utilisé pour les requêtes déterministes (température 0).
+        :param embedding_cache: Cache des embeddings par hash du texte (LRU en mémoire par défaut).
+        :param rate_limiter: Limiteur partagé appelé avant chaque requête Converse / ConverseStream envoyée à Bedrock
+            (les réponses servies par le cache ne sont pas comptées).
+        :param embedding_rate_limiter: Limiteur appelé avant chaque calcul d'embedding envoyé à Bedrock, distinct de
+            `rate_limiter` (les quotas des modèles d'embedding sont bien plus élevés que ceux de Converse).
         """
         self.session = boto3.Session()
         self.bedrock = self.session.client(
             service_name=service_name, region_name=region)
+        self.cache = cache
+        self.embedding_cache = embedding_cache if embedding_cache is not None else MemoryCache(
+            maxsize=16384)
+        self.rate_limiter = rate_limiter
+        self.embedding_rate_limiter = embedding_rate_limiter
         pass
 
-    def converse_raw(self,
-                     model_id: str,
-                     messages: List[ConverseMessage],
-                     max_tokens: int = 100,
-                     temperature: float = 0,
-                     **kwargs: dict) -> dict:
+    def build_request(self,
+                      model_id: str,
+                      messages: List[ConverseMessage],
+                      max_tokens: int = 100,
+                      temperature: float = 0,
+                      tool_config: dict | None = None,
+                      **kwargs: dict) -> dict:
         """
-        Converse avec un modèle Bedrock.
+        Valide les paramètres et construit la requête pour les APIs Converse / ConverseStream.
 
-        :param model_id: ID du modèle Bedrock.
-        :param messages: Liste de messages pour la conversation.
-        :param max_tokens: Nombre maximum de tokens à générer.
-        :param temperature: Température pour l'échantillonnage.
-        :param top_p: Seuil pour le top-p sampling.
-        :param kwargs: Arguments supplémentaires.
+        :param tool_config: Configuration d'outils de l'API Converse (voir `tool_config_for`).
 
-        :return: Réponse du modèle Bedrock. (dict)
+        :return: Arguments de la requête Bedrock. (dict)
         """
-
         # verif des arguments
         valid_keys = ['presencePenalty', 'frequencyPenalty', 'top_k', 'top_p']
         for key in kwargs.keys():
@@ -95,15 +190,66 @@ class WrapperBedrock:
             raise ValueError(
                 f"'top_p' doit être entre 0 et 1, reçu : {kwargs['top_p']}")
 
-        response = self.get_client().converse(
-            modelId=model_id,
-            messages=[message.model_dump() for message in messages],
-            inferenceConfig={
+        request = {
+            "modelId": model_id,
+            "messages": [message.model_dump() for message in messages],
+            "inferenceConfig": {
                 "maxTokens": max_tokens,
                 "temperature": temperature,
                 **kwargs
             }
-        )
+        }
+        if tool_config is not None:
+            request["toolConfig"] = tool_config
+        return request
+
+    def response_cache(self, use_cache: bool, temperature: float) -> ResponseCache | None:
+        """
+        Cache des réponses à utiliser pour une requête, None si la réponse ne doit pas être mise en cache
+        (cache désactivé, ou température non nulle : la réponse n'est pas déterministe).
+        """
+        return self.cache if use_cache and temperature == 0 else None
+
+    def converse_raw(self,
+                     model_id: str,
+                     messages: List[ConverseMessage],
+                     max_tokens: int = 100,
+                     temperature: float = 0,
+                     use_cache: bool = True,
+                     tool_config: dict | None = None,
+                     **kwargs: dict) -> dict:
+        """
+        Converse avec un modèle Bedrock.
+
+        :param model_id: ID du modèle Bedrock.
+        :param messages: Liste de messages pour la conversation.
+        :param max_tokens: Nombre maximum de tokens à générer.
+        :param temperature: Température pour l'échantillonnage.
+        :param top_p: Seuil pour le top-p sampling.
+        :param use_cache: Utilise le cache de réponses s'il est configuré.
+        :param tool_config: Configuration d'outils de l'API Converse, incluse dans la clé de cache.
+        :param kwargs: Arguments supplémentaires.
+
+        :return: Réponse du modèle Bedrock. (dict)
+        """
+        request = self.build_request(
+            model_id, messages, max_tokens, temperature, tool_config, **kwargs)
+
+        cache = self.response_cache(use_cache, temperature)
+        if cache is not None:
+            key = ResponseCache.make_key(request)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        response = self.get_client().converse(**request)
+
+        if cache is not None and is_cacheable_response(response):
+            # les métadonnées HTTP de la réponse ne sont pas mises en cache
+            cache.set(key, {k: v for k, v in response.items()
+                      if k != "ResponseMetadata"})
 
         # to return str response use response['output']['messages']['content']
         return response
@@ -113,9 +259,84 @@ class WrapperBedrock:
                  messages: List[ConverseMessage],
                  max_tokens: int = 100,
                  temperature: float = 0,
+                 use_cache: bool = True,
                  **kwargs: dict) -> ConverseMessage:
 
-        return ConverseMessage.model_validate_json(json.dumps(self.converse_raw(model_id, messages, max_tokens, temperature, **kwargs)["output"]["message"]))
+        return ConverseMessage.model_validate_json(json.dumps(self.converse_raw(model_id, messages, max_tokens, temperature, use_cache, **kwargs)["output"]["message"]))
+
+    def converse_structured(self,
+                            model_id: str,
+                            messages: List[ConverseMessage],
+                            output_model: type[BaseModel],
+                            max_tokens: int = 1024,
+                            temperature: float = 0,
+                            use_cache: bool = True,
+                            **kwargs: dict) -> BaseModel:
+        """
+        Converse avec un modèle Bedrock en imposant une réponse structurée (tool use), validée par `output_model`.
+        Si le modèle répond en texte plutôt qu'avec l'outil, le JSON du texte est validé à la place.
+
+        :param output_model: Modèle pydantic de la réponse attendue.
+
+        :raises ValidationError: Si la réponse ne respecte pas le schéma.
+        :raises json.JSONDecodeError: Si la réponse texte ne contient pas de JSON.
+
+        :return: Réponse validée. (instance de `output_model`)
+        """
+        response = self.converse_raw(model_id, messages, max_tokens, temperature, use_cache,
+                                     tool_config=tool_config_for(output_model), **kwargs)
+        content = response["output"]["message"]["content"]
+        for block in content:
+            if "toolUse" in block:
+                return output_model.model_validate(block["toolUse"]["input"])
+        return output_model.model_validate(parse_json_response("".join(block.get("text", "") for block in content)))
+
+    def converse_stream(self,
+                        model_id: str,
+                        messages: List[ConverseMessage],
+                        max_tokens: int = 100,
+                        temperature: float = 0,
+                        use_cache: bool = True,
+                        **kwargs: dict) -> Iterator[str]:
+        """
+        Converse avec un modèle Bedrock en renvoyant le texte au fur et à mesure de sa génération (API ConverseStream).
+        Mêmes paramètres que `converse_raw`, les réponses partagent le même cache.
+
+        Les paramètres sont validés dès l'appel, avant la création du générateur.
+
+        :return: Générateur des morceaux de texte de la réponse.
+        """
+        request = self.build_request(
+            model_id, messages, max_tokens, temperature, **kwargs)
+
+        cache = self.response_cache(use_cache, temperature)
+        key = None
+        if cache is not None:
+            key = ResponseCache.make_key(request)
+            cached = cache.get(key)
+            if cached is not None:
+                return iter(["".join(c.get("text", "") for c in cached["output"]["message"]["content"])])
+        return self._stream_text(request, cache, key)
+
+    def _stream_text(self, request: dict, cache: ResponseCache | None, key: str | None) -> Iterator[str]:
+        text = []
+        stop_reason = None
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        response = self.get_client().converse_stream(**request)
+        for event in response["stream"]:
+            if "contentBlockDelta" in event:
+                delta = event["contentBlockDelta"]["delta"].get("text", "")
+                text.append(delta)
+                yield delta
+            elif "messageStop" in event:
+                stop_reason = event["messageStop"].get("stopReason")
+
+        # seule une réponse lue jusqu'au bout et complète est mise en cache (pas en cas d'erreur ou d'arrêt de la lecture)
+        response = {"output": {"message": {"role": "assistant", "content": [{"text": "".join(text)}]}},
+                    "stopReason": stop_reason}
+        if cache is not None and is_cacheable_response(response):
+            cache.set(key, response)
 
     def get_embedding(self, text: str, embed_model_id: str = "amazon.titan-embed-text-v2:0") -> np.ndarray:
         """
@@ -124,8 +345,15 @@ class WrapperBedrock:
         :param text: Texte à encoder.
         :param embed_model_id: ID du modèle d'embedding.
 
-        :return: Embedding du texte.
+        :return: Embedding du texte. (float32)
         """
+        key = ResponseCache.make_key(embed_model_id, text)
+        cached = self.embedding_cache.get(key)
+        if cached is not None:
+            return np.asarray(cached, dtype=np.float32)
+
+        if self.embedding_rate_limiter is not None:
+            self.embedding_rate_limiter.acquire()
         # Appel au modèle Bedrock pour obtenir l'embedding
         response = self.get_client().invoke_model(
             body=json.dumps({"inputText": text}),
@@ -135,10 +363,83 @@ class WrapperBedrock:
         )
 
         response_body = json.loads(response['body'].read())
-        return response_body['embedding']
+        self.embedding_cache.set(key, response_body['embedding'])
+        return np.asarray(response_body['embedding'], dtype=np.float32)
+
+    def get_embeddings(self, texts: List[str], embed_model_id: str = "amazon.titan-embed-text-v2:0", max_workers: int = 8) -> np.ndarray:
+        """
+        Récupère les embeddings de plusieurs textes, les appels Bedrock étant faits en parallèle.
+
+        :param texts: Textes à encoder.
+        :param embed_model_id: ID du modèle d'embedding.
+        :param max_workers: Nombre maximal d'appels simultanés.
+
+        :return: Matrice (len(texts), dimension) des embeddings. (float32)
+        """
+        # les textes en double ne sont encodés qu'une fois
+        unique = list(dict.fromkeys(texts))
+        if not unique:
+            return np.empty((0, 0), dtype=np.float32)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+            embeddings = dict(zip(unique, pool.map(
+                lambda t: self.get_embedding(t, embed_model_id), unique)))
+
+        matrix = np.empty(
+            (len(texts), len(embeddings[unique[0]])), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = embeddings[text]
+        return matrix
 
     def get_session(self) -> boto3.Session:
         return self.session
 
     def get_client(self) -> boto3.client:
         return self.bedrock
+
+
+class AsyncWrapperBedrock:
+    def __init__(self, wrapper: WrapperBedrock):
+        """
+        Version asynchrone de WrapperBedrock.
+
+        Les appels boto3 étant bloquants, ils sont déportés sur le pool de threads de la boucle asyncio :
+        les coroutines peuvent ainsi attendre plusieurs appels Bedrock en même temps sans bloquer la boucle.
+
+        :param wrapper: WrapperBedrock utilisé pour les appels (client, cache de réponses).
+        """
+        self.wrapper = wrapper
+
+    async def converse_raw(self,
+                           model_id: str,
+                           messages: List[ConverseMessage],
+                           max_tokens: int = 100,
+                           temperature: float = 0,
+                           use_cache: bool = True,
+                           **kwargs: dict) -> dict:
+        return await asyncio.to_thread(self.wrapper.converse_raw, model_id, messages, max_tokens, temperature, use_cache, **kwargs)
+
+    async def converse(self,
+                       model_id: str,
+                       messages: List[ConverseMessage],
+                       max_tokens: int = 100,
+                       temperature: float = 0,
+                       use_cache: bool = True,
+                       **kwargs: dict) -> ConverseMessage:
+        return await asyncio.to_thread(self.wrapper.converse, model_id, messages, max_tokens, temperature, use_cache, **kwargs)
+
+    async def converse_structured(self,
+                                  model_id: str,
+                                  messages: List[ConverseMessage],
+                                  output_model: type[BaseModel],
+                                  max_tokens: int = 1024,
+                                  temperature: float = 0,
+                                  use_cache: bool = True,
+                                  **kwargs: dict) -> BaseModel:
+        return await asyncio.to_thread(self.wrapper.converse_structured, model_id, messages, output_model, max_tokens, temperature, use_cache, **kwargs)
+
+    async def get_embedding(self, text: str, embed_model_id: str = "amazon.titan-embed-text-v2:0") -> np.ndarray:
+        return await asyncio.to_thread(self.wrapper.get_embedding, text, embed_model_id)
+
+    async def get_embeddings(self, texts: List[str], embed_model_id: str = "amazon.titan-embed-text-v2:0", max_workers: int = 8) -> np.ndarray:
+        return await asyncio.to_thread(self.wrapper.get_embeddings, texts, embed_model_id, max_workers)
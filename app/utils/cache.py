@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any
+
+
+class ResponseCache(ABC):
+    def __init__(self, ttl: float | None = None):
+        """
+        Cache clé / valeur avec durée de vie, base des différents backends.
+
+        :param ttl: Durée de vie par défaut des entrées en secondes (None = pas d'expiration).
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        Construit une clé déterministe à partir d'éléments sérialisables en JSON.
+        """
+        serialized = json.dumps(parts, sort_keys=True,
+                                ensure_ascii=False, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def _expires_at(self, ttl: float | None) -> float | None:
+        ttl = self.ttl if ttl is None else ttl
+        return None if ttl is None else time.time() + ttl
+
+    def get(self, key: str) -> Any | None:
+        """
+        Renvoie la valeur associée à `key`, ou None si absente ou expirée.
+        """
+        value = self._get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self._set(key, value, self._expires_at(ttl))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+    @abstractmethod
+    def _get(self, key: str) -> Any | None:
+        ...
+
+    @abstractmethod
+    def _set(self, key: str, value: Any, expires_at: float | None) -> None:
+        ...
+
+
+class MemoryCache(ResponseCache):
+    def __init__(self, maxsize: int = 256, ttl: float | None = None):
+        """
+        Cache LRU en mémoire.
+
+        :param maxsize: Nombre maximal d'entrées conservées.
+        :param ttl: Durée de vie par défaut des entrées en secondes.
+        """
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+
+    def _get(self, key: str) -> Any | None:
+        with self.lock:
+            if key not in self.entries:
+                return None
+            expires_at, value = self.entries[key]
+            if expires_at is not None and expires_at < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: Any, expires_at: float | None) -> None:
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteCache(ResponseCache):
+    def __init__(self, path: str = ".cache/responses.sqlite", ttl: float | None = None):
+        """
+        Cache persistant dans un fichier SQLite, les valeurs doivent être sérialisables en JSON.
+
+        :param path: Chemin du fichier SQLite.
+        :param ttl: Durée de vie par défaut des entrées en secondes.
+        """
+        super().__init__(ttl)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # `with db` ne fait que valider la transaction : la connexion est fermée par closing
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _get(self, key: str) -> Any | None:
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < time.time():
+                db.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, expires_at: float | None) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                       (key, json.dumps(value, ensure_ascii=False, default=str), expires_at))
+
+    def clear(self) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM cache")
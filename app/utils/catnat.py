@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+import pandas as pd
+
+# colonnes de date des arrêtés CATNAT (format jj/mm/aaaa dans l'API Géorisques)
+CATNAT_DATE_COLUMNS = ["date_debut_evt", "date_fin_evt",
+                       "date_publication_arrete", "date_publication_jo"]
+# colonnes à faible cardinalité stockées en catégories
+CATNAT_CATEGORY_COLUMNS = ["libelle_risque_jo",
+                           "code_insee", "libelle_commune"]
+
+
+# colonnes de l'export national GASPAR CATNAT -> colonnes de l'API Géorisques
+GASPAR_COLUMNS = {
+    "cod_nat_catnat": "code_national_catnat",
+    "cod_commune": "code_insee",
+    "lib_commune": "libelle_commune",
+    "lib_risque_jo": "libelle_risque_jo",
+    "dat_deb": "date_debut_evt",
+    "dat_fin": "date_fin_evt",
+    "dat_pub_arrete": "date_publication_arrete",
+    "dat_pub_jo": "date_publication_jo",
+}
+CATNAT_COLUMNS = list(GASPAR_COLUMNS.values())
+
+
+def typed_catnat_frame(records: list[dict] | pd.DataFrame, date_format: str = "%d/%m/%Y") -> pd.DataFrame:
+    """
+    Construit un DataFrame typé à partir des arrêtés CATNAT : dates en datetime64, libellés en catégories.
+    """
+    df = pd.DataFrame.from_records(records) if not isinstance(
+        records, pd.DataFrame) else records
+    for col in CATNAT_DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(
+                df[col], format=date_format, errors="coerce")
+    for col in CATNAT_CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+class CatnatCache:
+    def __init__(self, directory: str = ".cache/catnat", ttl: float = 7 * 24 * 3600):
+        """
+        Cache Parquet des arrêtés CATNAT, un fichier par code INSEE.
+
+        :param directory: Dossier du cache.
+        :param ttl: Durée (en secondes) pendant laquelle un fichier est considéré à jour.
+        """
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, code_insee: str) -> str:
+        return os.path.join(self.directory, f"{code_insee}.parquet")
+
+    def read(self, code_insee: str, columns: list[str] | None = None) -> pd.DataFrame | None:
+        """
+        Lit les arrêtés d'une commune s'ils sont en cache et à jour, None sinon.
+        """
+        path = self.path(code_insee)
+        if not os.path.exists(path) or time.time() - os.path.getmtime(path) > self.ttl:
+            return None
+        return pd.read_parquet(path, columns=columns)
+
+    def write(self, code_insee: str, df: pd.DataFrame) -> None:
+        path = self.path(code_insee)
+        # dossier créé à la première écriture, pas à la construction du scrapper
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+
+class CatnatStore:
+    def __init__(self, path: str = ".cache/catnat.sqlite"):
+        """
+        Base locale des arrêtés CATNAT de toutes les communes, alimentée par l'export national GASPAR
+        et indexée par code INSEE et date de début d'événement.
+
+        :param path: Chemin du fichier SQLite.
+        """
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("CREATE TABLE IF NOT EXISTS catnat ({})".format(
+                ", ".join(f"{col} TEXT" for col in CATNAT_COLUMNS)))
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS catnat_insee_date ON catnat (code_insee, date_debut_evt)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def ingest_csv(self, csv_path: str, sep: str = ";", chunksize: int = 100000) -> int:
+        """
+        Remplace le contenu de la base par un export CSV des arrêtés CATNAT.
+        Les colonnes peuvent suivre l'export GASPAR (`cod_commune`, `dat_deb`...) ou l'API Géorisques (`code_insee`, `date_debut_evt`...).
+
+        :return: Nombre d'arrêtés importés.
+        """
+        count = 0
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM catnat")
+            for chunk in pd.read_csv(csv_path, sep=sep, dtype=str, chunksize=chunksize):
+                chunk = chunk.rename(columns=GASPAR_COLUMNS).reindex(
+                    columns=CATNAT_COLUMNS)
+                # dates stockées en ISO 8601 pour que l'ordre du texte soit l'ordre chronologique
+                for col in CATNAT_DATE_COLUMNS:
+                    # une colonne absente du CSV est recréée par reindex en float64 (NaN), sans accesseur .str
+                    values = chunk[col].astype("string")
+                    dayfirst = values.str.contains("/", na=False).any()
+                    chunk[col] = pd.to_datetime(
+                        values, dayfirst=dayfirst, format="mixed", errors="coerce").dt.strftime("%Y-%m-%d")
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                db.executemany("INSERT INTO catnat ({}) VALUES ({})".format(", ".join(CATNAT_COLUMNS), ", ".join("?" * len(CATNAT_COLUMNS))),
+                               chunk.itertuples(index=False, name=None))
+                count += len(chunk)
+        return count
+
+    def query(self, codes_insee: str | list[str], start: str | None = None, end: str | None = None) -> pd.DataFrame:
+        """
+        Arrêtés CATNAT d'une ou plusieurs communes, éventuellement restreints à une période (dates ISO `AAAA-MM-JJ` incluses).
+
+        :return: DataFrame typé avec les colonnes de l'API Géorisques.
+        """
+        codes = [codes_insee] if isinstance(codes_insee, str) else list(codes_insee)
+        query = "SELECT {} FROM catnat WHERE code_insee IN ({})".format(
+            ", ".join(CATNAT_COLUMNS), ", ".join("?" * len(codes)))
+        params = list(codes)
+        if start is not None:
+            query += " AND date_debut_evt >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND date_debut_evt <= ?"
+            params.append(end)
+        with closing(self._connect()) as db, db:
+            df = pd.read_sql_query(
+                query + " ORDER BY code_insee, date_debut_evt", db, params=params)
+        return typed_catnat_frame(df, date_format="%Y-%m-%d")
+
+    def aggregate(self, codes_insee: list[str], start: str | None = None, end: str | None = None) -> pd.DataFrame:
+        """
+        Nombre d'arrêtés par type de risque sur un ensemble de communes (département, région...).
+        """
+        df = self.query(codes_insee, start, end)
+        return df.groupby("libelle_risque_jo", observed=True).size().rename("nombre_arretes").reset_index()
+
+
+if __name__ == "__main__":
+    # python -m app.utils.catnat <export catnat_gaspar.csv> [base sqlite]
+    store = CatnatStore(*sys.argv[2:3])
+    print(f"{store.ingest_csv(sys.argv[1])} arrêtés importés dans {store.path}")
@@ -1,14 +1,62 @@
 from functools import wraps
 from inspect import signature, cleandoc
-from jinja2 import Template
-from typing import Callable, Any
-import re
+from jinja2 import Environment, DictLoader, FileSystemBytecodeCache
+from jinja2.bccache import Bucket
+from pydantic import BaseModel, ValidationError
+from typing import Callable, Any, Iterator
+import os
 import json
+import threading
+import time
+
+# sources des templates de prompt, enregistrées à la décoration
+_PROMPT_SOURCES: dict[str, str] = {}
+_PROMPT_METRICS: dict[str, dict] = {}
+_PROMPT_METRICS_LOCK = threading.Lock()
+
+
+class LazyBytecodeCache(FileSystemBytecodeCache):
+    """
+    Cache de bytecode jinja sur disque dont le dossier n'est créé qu'à la première écriture,
+    et non à l'import du module (la lecture d'un dossier absent est déjà traitée comme un cache vide).
+    """
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+# environnement partagé : les templates sont compilés une fois, le bytecode est conservé entre deux lancements
+PROMPT_ENVIRONMENT = Environment(loader=DictLoader(_PROMPT_SOURCES),
+                                 bytecode_cache=LazyBytecodeCache(".cache/jinja"),
+                                 auto_reload=False)
+PROMPT_ENVIRONMENT.globals["enumerate"] = enumerate
+
+
+def prompt_metrics() -> dict[str, dict]:
+    """
+    Statistiques de rendu de chaque template de prompt ({"calls", "total_time", "max_time", "chars"}).
+    """
+    with _PROMPT_METRICS_LOCK:
+        return {name: dict(metrics) for name, metrics in _PROMPT_METRICS.items()}
+
+
+def _record_render(name: str, elapsed: float, chars: int) -> None:
+    with _PROMPT_METRICS_LOCK:
+        metrics = _PROMPT_METRICS[name]
+        metrics["calls"] += 1
+        metrics["total_time"] += elapsed
+        metrics["max_time"] = max(metrics["max_time"], elapsed)
+        metrics["chars"] += chars
+
 
 def prompt_template(func) -> Callable[..., Any]:
     """
     Marque la docstring d'une fonction comme étant un template de prompt utilisant jinja
 
+    Le template est compilé une seule fois, à la décoration. `mon_prompt.stream(...)` rend le prompt morceau par
+    morceau sans construire la chaîne complète, `mon_prompt.metrics()` renvoie les statistiques de rendu.
+
     Exemple:
 
     @prompt_template
@@ -19,39 +67,205 @@ def prompt_template(func) -> Callable[..., Any]:
     pass
 
     """
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        # signature de la fonction
-        sig = signature(func)
+    name = f"{func.__module__}.{func.__qualname__}"
+    _PROMPT_SOURCES[name] = cleandoc(func.__doc__)
+    template = PROMPT_ENVIRONMENT.get_template(name)
+    # signature de la fonction
+    sig = signature(func)
+    with _PROMPT_METRICS_LOCK:
+        _PROMPT_METRICS[name] = {"calls": 0, "total_time": 0.0,
+                                 "max_time": 0.0, "chars": 0}
+
+    def context(*args, **kwargs) -> dict:
         bound_args = sig.bind(*args, **kwargs)
         bound_args.apply_defaults()
+        return bound_args.arguments
 
-        # création template avec jinja
-        template = Template(cleandoc(func.__doc__))
-        context = bound_args.arguments
-        context['enumerate'] = enumerate
-        return template.render(bound_args.arguments)
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        prompt = template.render(context(*args, **kwargs))
+        _record_render(name, time.perf_counter() - start, len(prompt))
+        return prompt
 
+    def stream(*args, **kwargs) -> Iterator[str]:
+        start = time.perf_counter()
+        chars = 0
+        for part in template.generate(context(*args, **kwargs)):
+            chars += len(part)
+            yield part
+        _record_render(name, time.perf_counter() - start, chars)
+
+    wrapper.stream = stream
+    wrapper.metrics = lambda: prompt_metrics()[name]
+    wrapper.template = template
     return wrapper
 
 
-def parse_json_response(response: str):
+class JsonStreamParser:
+    _CLOSERS = {"{": "}", "[": "]"}
+
+    def __init__(self, model: type[BaseModel] | None = None, key: str | None = None):
+        """
+        Parser JSON incrémental d'une réponse de LLM, alimenté morceau par morceau (`feed`).
+
+        Les éléments d'un tableau cible sont renvoyés dès qu'ils sont complets, validés par `model` s'il est donné,
+        et une réponse tronquée peut être réparée en ne conservant que ses éléments complets (`result(partial=True)`).
+
+        :param model: Modèle pydantic des éléments du tableau cible (éléments bruts si None).
+        :param key: Clé du tableau cible dans l'objet racine (None si la racine est elle-même le tableau).
+        """
+        self.model = model
+        self.key = key
+        self.buffer = ""
+        self.pos = 0
+        self.start = None
+        self.end = None
+        self.stack: list[str] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_string = None
+        self.current_key = None
+        self.target_depth = None
+        self.target_done = False
+        self.item_start = None
+        # dernière position où couper la réponse en gardant un JSON valide une fois les conteneurs refermés
+        self.safe_cut = None
+        self.safe_stack: list[str] = []
+
+    def _emit(self, raw: str, items: list) -> None:
+        try:
+            item = json.loads(raw)
+            items.append(self.model.model_validate(item) if self.model is not None else item)
+        except (json.JSONDecodeError, ValidationError):
+            # un élément invalide n'empêche pas la lecture des suivants
+            pass
+
+    def _mark_safe(self, cut: int) -> None:
+        self.safe_cut = cut
+        self.safe_stack = list(self.stack)
+
+    def feed(self, chunk: str) -> list:
+        """
+        Ajoute un morceau de la réponse.
+
+        :return: Éléments du tableau cible complétés par ce morceau.
+        """
+        items = []
+        self.buffer += chunk
+        buffer = self.buffer
+        for i in range(self.pos, len(buffer)):
+            if self.end is not None:
+                break
+            c = buffer[i]
+            if self.start is None:
+                if c in "{[":
+                    self.start = i
+                else:
+                    continue
+            in_target = self.target_depth is not None and len(self.stack) == self.target_depth
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    self.last_string = buffer[self.string_start:i + 1]
+            elif c == '"':
+                self.in_string = True
+                self.string_start = i
+                if in_target and self.item_start is None:
+                    self.item_start = i
+            elif c == ":":
+                if len(self.stack) == 1 and self.stack[0] == "{" and self.last_string is not None:
+                    self.current_key = json.loads(self.last_string)
+            elif c in "{[":
+                if in_target and self.item_start is None:
+                    self.item_start = i
+                self.stack.append(c)
+                if c == "[" and self.target_depth is None and not self.target_done and (
+                        (self.key is None and len(self.stack) == 1) or
+                        (self.key is not None and len(self.stack) == 2 and self.current_key == self.key)):
+                    self.target_depth = len(self.stack)
+                if len(self.stack) == 1:
+                    # un conteneur imbriqué ne devient sûr qu'avec son premier élément complet
+                    self._mark_safe(i + 1)
+            elif c in "}]":
+                if in_target and self.item_start is not None:
+                    # fin d'un élément scalaire, dernier élément du tableau cible
+                    self._emit(buffer[self.item_start:i].strip(), items)
+                    self.item_start = None
+                if self.stack:
+                    self.stack.pop()
+                if self.target_depth is not None:
+                    if len(self.stack) == self.target_depth and self.item_start is not None:
+                        self._emit(buffer[self.item_start:i + 1], items)
+                        self.item_start = None
+                    elif len(self.stack) < self.target_depth:
+                        self.target_depth = None
+                        self.target_done = True
+                self._mark_safe(i + 1)
+                if not self.stack:
+                    self.end = i + 1
+            elif c == ",":
+                if in_target and self.item_start is not None:
+                    self._emit(buffer[self.item_start:i].strip(), items)
+                    self.item_start = None
+                self._mark_safe(i)
+            elif in_target and self.item_start is None and not c.isspace():
+                self.item_start = i
+        self.pos = len(buffer)
+        return items
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    def result(self, partial: bool = False) -> Any:
+        """
+        Valeur JSON complète de la réponse.
+
+        :param partial: Si la réponse est tronquée, renvoie la valeur réparée : les éléments (et paires clé/valeur)
+            incomplets en fin de réponse sont supprimés, y compris les conteneurs imbriqués encore vides.
+        :raises json.JSONDecodeError: Si la réponse est incomplète (et `partial` est faux) ou invalide.
+        """
+        if self.end is not None:
+            return json.loads(self.buffer[self.start:self.end])
+        if partial and self.safe_cut is not None:
+            closers = "".join(self._CLOSERS[c] for c in reversed(self.safe_stack))
+            return json.loads(self.buffer[self.start:self.safe_cut] + closers)
+        raise json.JSONDecodeError("Incomplete JSON response", self.buffer, self.pos)
+
+
+def parse_json_response(response: str, partial: bool = False):
     """
     Parse une réponse en JSON, qu'il s'agisse d'un dictionnaire ou d'un tableau.
 
+    La première valeur JSON valide de la réponse est décodée, le texte qui l'entoure est ignoré.
+
     :param response: Réponse à parser.
+    :param partial: Répare une réponse tronquée en ne gardant que ses éléments complets.
     :return: Réponse parsée en JSON (dict ou list).
     """
-    json_pattern = r'\[.*\]|\{.*\}'  # Adjusted to capture both array and object patterns
-    json_match = re.search(json_pattern, response, re.DOTALL)
-    
-    if json_match:
-        response_text = json_match.group(0)
-    else:
-        response_text = response
-    
-    try:
-        parsed_response = json.loads(response_text)
-        return parsed_response
-    except json.JSONDecodeError:
-        raise json.JSONDecodeError(f"Failed to parse response as JSON: {response_text}", response_text, 0)
\ No newline at end of file
+    decoder = json.JSONDecoder()
+    start = next((i for i, c in enumerate(response) if c in "{["), None)
+    while start is not None:
+        try:
+            return decoder.raw_decode(response, start)[0]
+        except json.JSONDecodeError:
+            pass
+        parser = JsonStreamParser()
+        parser.feed(response[start:])
+        if not parser.complete:
+            # valeur tronquée : les crochets suivants lui appartiennent
+            if partial:
+                try:
+                    return parser.result(partial=True)
+                except json.JSONDecodeError:
+                    pass
+            break
+        # texte entre crochets qui n'est pas du JSON (ex. "[page 3]"), la recherche reprend après
+        start = next((i for i in range(start + parser.end, len(response)) if response[i] in "{["), None)
+    raise json.JSONDecodeError(f"Failed to parse response as JSON: {response}", response, 0)
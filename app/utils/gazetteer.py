@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+import numpy as np
+from .http import get_http_client
+
+COMMUNES_URL = "https://geo.api.gouv.fr/communes?fields=nom,code,centre,codeDepartement,codeRegion,population&format=json"
+
+_GAZETTEER = None
+_GAZETTEER_FAILED = False
+_GAZETTEER_LOCK = threading.Lock()
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalise un nom de commune : minuscules, sans accents, tirets et apostrophes remplacés par des espaces.
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).lower()
+    for sep in ("-", "'", "’", "_"):
+        name = name.replace(sep, " ")
+    return " ".join(name.split())
+
+
+def trigrams(name: str) -> set[str]:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    def __init__(self, communes: list[dict]):
+        """
+        Index en mémoire des communes françaises (nom, code INSEE, centre, département, région).
+
+        Les recherches exactes passent par un dictionnaire des noms normalisés, les recherches approchées
+        par un index de trigrammes de caractères.
+
+        :param communes: Communes au format de geo.api.gouv.fr.
+        """
+        self.names = [c["nom"] for c in communes]
+        self.codes = [c["code"] for c in communes]
+        self.departements = [c.get("codeDepartement") for c in communes]
+        self.regions = [c.get("codeRegion") for c in communes]
+        self.population = np.array(
+            [c.get("population") or 0 for c in communes], dtype=np.int64)
+        # centre (longitude, latitude), NaN si inconnu
+        self.centres = np.array([c["centre"]["coordinates"] if c.get("centre") else (np.nan, np.nan)
+                                 for c in communes], dtype=np.float64)
+
+        self.by_code_index = {code: i for i, code in enumerate(self.codes)}
+        self.by_name: dict[str, list[int]] = defaultdict(list)
+        self.by_trigram: dict[str, list[int]] = defaultdict(list)
+        self.normalized = [normalize_name(name) for name in self.names]
+        for i, name in enumerate(self.normalized):
+            self.by_name[name].append(i)
+            for gram in trigrams(name):
+                self.by_trigram[gram].append(i)
+
+    @classmethod
+    def load(cls, path: str = ".cache/communes.json") -> "Gazetteer":
+        """
+        Charge la table des communes depuis `path`, en la téléchargeant une seule fois depuis geo.api.gouv.fr si absente.
+        """
+        if not os.path.exists(path):
+            response = get_http_client().get(COMMUNES_URL, timeout=(5, 60))
+            response.raise_for_status()
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(response.text)
+            os.replace(tmp, path)
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _to_dict(self, i: int) -> dict:
+        lon, lat = self.centres[i]
+        return {
+            "nom": self.names[i],
+            "code": self.codes[i],
+            "longitude": None if np.isnan(lon) else float(lon),
+            "latitude": None if np.isnan(lat) else float(lat),
+            "departement": self.departements[i],
+            "region": self.regions[i],
+        }
+
+    def by_code(self, code: str) -> dict | None:
+        i = self.by_code_index.get(code)
+        return None if i is None else self._to_dict(i)
+
+    def codes_in(self, departement: str | None = None, region: str | None = None) -> list[str]:
+        """
+        Codes INSEE des communes d'un département et / ou d'une région.
+        """
+        return [code for code, dep, reg in zip(self.codes, self.departements, self.regions)
+                if (departement is None or dep == departement) and (region is None or reg == region)]
+
+    def lookup(self, name: str, min_score: float = 0.5) -> dict | None:
+        """
+        Recherche la commune la plus proche d'un nom. En cas d'homonymes, la commune la plus peuplée est choisie.
+
+        :param name: Nom de la commune.
+        :param min_score: Score de Dice minimal (sur les trigrammes) pour une recherche approchée.
+
+        :return: Commune trouvée ({"nom", "code", "longitude", "latitude", "departement", "region"}) ou None.
+        """
+        target = normalize_name(name)
+        exact = self.by_name.get(target)
+        if exact:
+            return self._to_dict(max(exact, key=lambda i: self.population[i]))
+
+        grams = trigrams(target)
+        counts = Counter(i for gram in grams for i in self.by_trigram.get(gram, ()))
+        if not counts:
+            return None
+
+        def score(i: int) -> tuple[float, int]:
+            dice = 2 * counts[i] / (len(grams) + len(trigrams(self.normalized[i])))
+            return dice, self.population[i]
+
+        best = max((i for i, _ in counts.most_common(50)), key=score)
+        return self._to_dict(best) if score(best)[0] >= min_score else None
+
+
+def get_gazetteer(path: str = ".cache/communes.json") -> Gazetteer | None:
+    """
+    Gazetteer partagé par le processus, chargé au premier appel. None si la table n'a pas pu être chargée.
+    """
+    global _GAZETTEER, _GAZETTEER_FAILED
+    with _GAZETTEER_LOCK:
+        if _GAZETTEER is None and not _GAZETTEER_FAILED:
+            try:
+                _GAZETTEER = Gazetteer.load(path)
+            except Exception as e:
+                # pas de nouvelle tentative : les appelants se rabattent sur geo.api.gouv.fr
+                _GAZETTEER_FAILED = True
+                print(f"Impossible de charger la table des communes : {e}")
+        return _GAZETTEER
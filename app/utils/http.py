@@ -0,0 +1,81 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_HTTP_CLIENT = None
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+
+class ResponseTooLarge(Exception):
+    """
+    Levée quand le corps d'une réponse dépasse la taille maximale autorisée.
+    """
+    pass
+
+
+class HttpClient:
+    def __init__(self,
+                 pool_maxsize: int = 16,
+                 connect_timeout: float = 5,
+                 read_timeout: float = 30,
+                 retries: int = 3,
+                 backoff_factor: float = 0.5,
+                 max_download_bytes: int = 100 * 1024 ** 2):
+        """
+        Client HTTP partagé : connexions persistantes par hôte, délais d'attente et nouvelles tentatives.
+
+        :param pool_maxsize: Nombre maximal de connexions conservées par hôte.
+        :param connect_timeout: Délai maximal d'établissement d'une connexion (secondes).
+        :param read_timeout: Délai maximal entre deux lectures sur la connexion (secondes).
+        :param retries: Nombre de nouvelles tentatives sur erreur de connexion ou réponse 429 / 5xx.
+        :param backoff_factor: Facteur de l'attente exponentielle entre deux tentatives (secondes).
+        :param max_download_bytes: Taille maximale d'un corps de réponse lu avec `iter_content`.
+        """
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET", "HEAD"),
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_maxsize,
+                              pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_download_bytes = max_download_bytes
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def iter_content(self, response: requests.Response, chunk_size: int = 64 * 1024, max_bytes: int | None = None):
+        """
+        Itère sur le corps d'une réponse en streaming (`stream=True`) en imposant une taille maximale.
+
+        :raises ResponseTooLarge: Si le corps annoncé ou lu dépasse la taille maximale.
+        """
+        limit = self.max_download_bytes if max_bytes is None else max_bytes
+        length = response.headers.get("Content-Length", "")
+        if limit and length.isdigit() and int(length) > limit:
+            raise ResponseTooLarge(
+                f"{response.url} : {length} octets annoncés, limite {limit}")
+        total = 0
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            total += len(chunk)
+            if limit and total > limit:
+                raise ResponseTooLarge(
+                    f"{response.url} : plus de {limit} octets reçus")
+            yield chunk
+
+
+def get_http_client() -> HttpClient:
+    """
+    Client HTTP partagé par le processus, créé au premier appel.
+    """
+    global _HTTP_CLIENT
+    with _HTTP_CLIENT_LOCK:
+        if _HTTP_CLIENT is None:
+            _HTTP_CLIENT = HttpClient()
+        return _HTTP_CLIENT
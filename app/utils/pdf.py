@@ -0,0 +1,125 @@
+import fitz
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Iterator
+
+_EXTRACTION_POOL = None
+_EXTRACTION_POOL_LOCK = threading.Lock()
+
+# approximation du nombre de caractères par token pour les budgets en tokens
+CHARS_PER_TOKEN = 4
+# budget par défaut d'extraction d'un document (environ 250 000 tokens)
+DEFAULT_MAX_CHARS = 1_000_000
+
+
+def iter_pages(pdf_document: fitz.Document,
+               max_chars: int | None = None,
+               max_tokens: int | None = None,
+               skip_empty: bool = True) -> Iterator[tuple[int, str]]:
+    """
+    Itère sur le texte des pages d'un PDF, en s'arrêtant dès que le budget est atteint :
+    les pages suivantes ne sont ni lues ni extraites.
+
+    :param pdf_document: Document PyMuPDF ouvert.
+    :param max_chars: Nombre maximal de caractères extraits (la dernière page est tronquée).
+    :param max_tokens: Nombre maximal (approximatif) de tokens extraits.
+    :param skip_empty: Ignore les pages sans texte (pages scannées / images seules).
+
+    :return: Générateur de (numéro de page à partir de 1, texte de la page).
+    """
+    budgets = [b for b in (max_chars, max_tokens and max_tokens * CHARS_PER_TOKEN) if b is not None]
+    budget = min(budgets) if budgets else None
+    total = 0
+    for page in pdf_document:
+        text = page.get_text()
+        if skip_empty and not text.strip():
+            continue
+        if budget is not None and total + len(text) >= budget:
+            if budget > total:
+                yield page.number + 1, text[:budget - total]
+            return
+        total += len(text)
+        yield page.number + 1, text
+
+
+def pages_to_text(pages: Iterator[tuple[int, str]]) -> str:
+    """
+    Concatène les pages en un texte, chaque page étant précédée de son numéro pour pouvoir être citée.
+    """
+    return "\n".join(f"[page {number}]\n{text}" for number, text in pages)
+
+
+def extract_pdf_text(data: bytes, max_chars: int | None = DEFAULT_MAX_CHARS) -> str:
+    """
+    Extrait le texte d'un PDF, page par page, dans la limite de `max_chars` caractères.
+
+    :param data: Contenu brut du PDF.
+    :param max_chars: Budget de caractères extraits (None pour tout le document).
+    :return: Texte du PDF, chaque page précédée de son numéro.
+    """
+    with fitz.open("pdf", data) as pdf_document:
+        return pages_to_text(iter_pages(pdf_document, max_chars=max_chars))
+
+
+def _extract_file_pages(path: str, max_chars: int | None) -> list[tuple[int, str]]:
+    """
+    Extraction dans un processus du pool d'un PDF sur disque, ouvert directement par PyMuPDF.
+    """
+    with fitz.open(path) as pdf_document:
+        return list(iter_pages(pdf_document, max_chars=max_chars))
+
+
+def _warm_up() -> int:
+    """
+    Tâche vide : son dépickling dans un processus du pool y importe ce module, donc PyMuPDF.
+    """
+    return os.getpid()
+
+
+class PdfExtractionPool:
+    def __init__(self, max_workers: int | None = None):
+        """
+        Service d'extraction de texte dans un pool de processus, l'extraction PyMuPDF étant limitée par le GIL.
+
+        Les PDFs sont lus sur disque par les processus : seul leur chemin est transmis, sans copie sérialisée (pickle).
+
+        :param max_workers: Nombre de processus (nombre de CPUs par défaut).
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # spawn plutôt que fork : le processus streamlit est multi-thread
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit_file(self, path: str, max_chars: int | None = DEFAULT_MAX_CHARS) -> Future:
+        """
+        Lance l'extraction d'un PDF déjà sur disque : seul son chemin est transmis au processus.
+
+        :return: Future du texte des pages, liste de (numéro de page, texte).
+        """
+        return self.executor.submit(_extract_file_pages, path, max_chars)
+
+    def warm_up(self) -> None:
+        """
+        Démarre tous les processus du pool (et leur import de PyMuPDF) avant la première extraction.
+        """
+        for future in [self.executor.submit(_warm_up) for _ in range(self.max_workers)]:
+            future.result()
+
+    def extract_file_text(self, path: str, max_chars: int | None = DEFAULT_MAX_CHARS) -> str:
+        return pages_to_text(self.submit_file(path, max_chars).result())
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+
+
+def get_extraction_pool(max_workers: int | None = None) -> PdfExtractionPool:
+    """
+    Service d'extraction partagé par le processus, créé au premier appel.
+    """
+    global _EXTRACTION_POOL
+    with _EXTRACTION_POOL_LOCK:
+        if _EXTRACTION_POOL is None:
+            _EXTRACTION_POOL = PdfExtractionPool(max_workers)
+        return _EXTRACTION_POOL
@@ -0,0 +1,180 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+_PDF_CACHE = None
+_PDF_CACHE_LOCK = threading.Lock()
+
+
+class PdfCache:
+    def __init__(self, directory: str = ".cache/pdf", max_bytes: int = 1024 ** 3, max_age: float = 24 * 3600):
+        """
+        Cache disque des PDFs téléchargés et de leur texte extrait.
+
+        Les fichiers sont adressés par le hash SHA-256 de leur contenu (deux URLs servant le même PDF partagent
+        les mêmes fichiers) et un index SQLite associe chaque URL à son hash et à ses en-têtes de revalidation HTTP.
+
+        :param directory: Dossier du cache.
+        :param max_bytes: Taille maximale du cache sur disque, les contenus les moins récemment utilisés sont supprimés au-delà.
+        :param max_age: Durée (en secondes) pendant laquelle une entrée est utilisée sans revalidation auprès du serveur.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, sha256 TEXT NOT NULL, etag TEXT, last_modified TEXT, fetched_at REAL NOT NULL)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=30)
+
+    def _path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{sha256}.{ext}")
+
+    @staticmethod
+    def hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def lookup(self, url: str) -> dict | None:
+        """
+        Renvoie l'entrée du cache pour une URL ({"url", "sha256", "etag", "last_modified", "fetched_at"}) ou None.
+        """
+        with closing(self._connect()) as db, db:
+            row = db.execute(
+                "SELECT url, sha256, etag, last_modified, fetched_at FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("url", "sha256", "etag", "last_modified", "fetched_at"), row))
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.max_age
+
+    def revalidation_headers(self, entry: dict | None) -> dict:
+        """
+        En-têtes de requête conditionnelle (If-None-Match / If-Modified-Since) pour revalider une entrée.
+        """
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def read_text(self, sha256: str) -> str | None:
+        """
+        Texte extrait du PDF de hash `sha256`, ou None s'il n'est pas (ou plus) en cache.
+        """
+        try:
+            with open(self._path(sha256, "txt"), encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?",
+                       (time.time(), sha256))
+        return text
+
+    def read_pdf(self, sha256: str) -> bytes | None:
+        """
+        Contenu brut du PDF de hash `sha256`, ou None s'il n'est pas (ou plus) en cache.
+        """
+        try:
+            with open(self._path(sha256, "pdf"), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def touch(self, url: str) -> None:
+        """
+        Marque l'entrée d'une URL comme revalidée (réponse 304 du serveur).
+        """
+        with closing(self._connect()) as db, db:
+            db.execute("UPDATE urls SET fetched_at = ? WHERE url = ?",
+                       (time.time(), url))
+
+    def put(self, url: str, content: bytes, text: str, etag: str | None = None, last_modified: str | None = None) -> str:
+        """
+        Stocke un PDF et son texte extrait pour une URL.
+
+        :return: Hash SHA-256 du contenu.
+        """
+        sha256 = self.hash(content)
+        tmp = self._path(sha256, "pdf.tmp")
+        with open(tmp, "wb") as f:
+            f.write(content)
+        self.put_file(url, tmp, sha256, text, etag, last_modified)
+        return sha256
+
+    def temp_file(self):
+        """
+        Fichier temporaire dans le dossier du cache, où télécharger un PDF avant de l'y déplacer avec `put_file`.
+        """
+        return tempfile.NamedTemporaryFile(dir=self.directory, suffix=".part", delete=False)
+
+    def put_file(self, url: str, path: str, sha256: str, text: str, etag: str | None = None, last_modified: str | None = None) -> None:
+        """
+        Stocke pour une URL un PDF déjà écrit sur disque (déplacé dans le cache, sans copie) et son texte extrait.
+
+        :param path: Fichier du PDF, sur le même système de fichiers que le cache.
+        :param sha256: Hash SHA-256 du contenu du PDF.
+        """
+        encoded = text.encode("utf-8")
+        now = time.time()
+        with self.lock:
+            if os.path.exists(self._path(sha256, "txt")):
+                os.remove(path)
+            else:
+                # écriture atomique pour ne jamais lire un fichier à moitié écrit
+                os.replace(path, self._path(sha256, "pdf"))
+                tmp = self._path(sha256, "txt.tmp")
+                with open(tmp, "wb") as f:
+                    f.write(encoded)
+                os.replace(tmp, self._path(sha256, "txt"))
+            size = os.path.getsize(self._path(sha256, "pdf")) + len(encoded)
+            with closing(self._connect()) as db, db:
+                db.execute("INSERT OR REPLACE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)",
+                           (sha256, size, now))
+                db.execute("INSERT OR REPLACE INTO urls (url, sha256, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                           (url, sha256, etag, last_modified, now))
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Supprime les contenus les moins récemment utilisés jusqu'à repasser sous `max_bytes`.
+        """
+        with closing(self._connect()) as db, db:
+            total = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for sha256, size in db.execute("SELECT sha256, size FROM blobs ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                for ext in ("pdf", "txt"):
+                    try:
+                        os.remove(self._path(sha256, ext))
+                    except FileNotFoundError:
+                        pass
+                db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                db.execute("DELETE FROM urls WHERE sha256 = ?", (sha256,))
+                total -= size
+
+
+def get_pdf_cache(directory: str = ".cache/pdf") -> PdfCache:
+    """
+    Cache des PDFs partagé par le processus, créé (avec son dossier) au premier appel.
+    """
+    global _PDF_CACHE
+    with _PDF_CACHE_LOCK:
+        if _PDF_CACHE is None:
+            _PDF_CACHE = PdfCache(directory)
+        return _PDF_CACHE
@@ -0,0 +1,42 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        """
+        Limiteur de débit à seau de jetons, partagé entre threads.
+
+        :param rate: Nombre de jetons ajoutés par seconde.
+        :param capacity: Nombre maximal de jetons disponibles d'un coup (rafale).
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError(
+                f"'rate' et 'capacity' doivent être positifs, reçu : {rate}, {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, tokens: int = 1) -> None:
+        """
+        Bloque jusqu'à ce que `tokens` jetons soient disponibles puis les consomme.
+        """
+        if tokens > self.capacity:
+            raise ValueError(
+                f"Impossible de consommer {tokens} jetons avec une capacité de {self.capacity}")
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,128 @@
+import math
+import re
+from collections import Counter
+from .gazetteer import normalize_name
+
+# mots outils français les plus fréquents, présents dans tout texte lisible
+FRENCH_COMMON_WORDS = set("""
+a au aux avec ce ces cette dans de des du elle en est et etre il ils la le les leur leurs lors mais meme
+ne ni nous on ou par pas plus pour qu que qui sa se selon ses son sont sur ta te tous tout toute toutes
+un une vers afin ainsi alors apres avant comme dont donc entre hors ici non notamment peut peuvent sans
+si sous tres y ete etre fait faire doit doivent chaque autre autres ensemble egalement
+""".split())
+
+# vocabulaire commun aux documents de prévention des risques des collectivités
+RISK_VOCABULARY = set("""
+risque risques alea aleas prevention inondation inondations crue crues secheresse incendie incendies feu
+foret tempete seisme sismique submersion erosion canicule chaleur argiles mouvement terrain catastrophe
+naturelle naturelles vulnerabilite exposition adaptation sauvegarde alerte secours plan zonage commune
+prefecture amenagement urbanisme climat climatique hydrique pollution biodiversite
+""".split())
+
+# seuils des heuristiques locales, seuls les documents entre les deux bornes sont soumis au LLM
+MIN_CHAR_ENTROPY = 3.0
+MAX_CHAR_ENTROPY = 5.5
+MIN_COMMON_WORD_RATIO = 0.15
+GIBBERISH_COMMON_WORD_RATIO = 0.05
+TOPIC_SCORE_RELEVANT = 20.0
+TOPIC_SCORE_NOT_RELEVANT = 3.0
+
+
+def tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z]+", normalize_name(text))
+
+
+def char_entropy(text: str) -> float:
+    """
+    Entropie de Shannon (en bits) de la distribution des caractères du texte.
+    """
+    counts = Counter(text)
+    total = sum(counts.values())
+    if total == 0:
+        return 0.0
+    return -sum(c / total * math.log2(c / total) for c in counts.values())
+
+
+def common_word_ratio(words: list[str]) -> float:
+    """
+    Part des mots du texte appartenant aux mots outils français.
+    """
+    if not words:
+        return 0.0
+    return sum(1 for w in words if w in FRENCH_COMMON_WORDS) / len(words)
+
+
+def gibberish_verdict(text: str, words: list[str]) -> tuple[str, dict]:
+    """
+    Classe un texte en "ok", "gibberish" ou "borderline" selon l'entropie de ses caractères et sa part de mots outils.
+    """
+    scores = {"entropy": char_entropy(text),
+              "common_words": common_word_ratio(words)}
+    if scores["common_words"] < GIBBERISH_COMMON_WORD_RATIO or not (MIN_CHAR_ENTROPY <= scores["entropy"] <= MAX_CHAR_ENTROPY):
+        return "gibberish", scores
+    if scores["common_words"] < MIN_COMMON_WORD_RATIO:
+        return "borderline", scores
+    return "ok", scores
+
+
+def topic_score(words: list[str], subject: str, keywords: list[str] | None = None) -> float:
+    """
+    Score de pertinence thématique : fréquence (pour 1000 mots, amortie par un log) des termes du type de document,
+    des risques demandés et du vocabulaire des risques, les termes spécifiques comptant double.
+    """
+    if not words:
+        return 0.0
+    counts = Counter(words)
+    specific = {w for term in [subject, *(keywords or [])] for w in tokenize(term)
+                if len(w) > 2 and w not in FRENCH_COMMON_WORDS}
+    score = 0.0
+    for term in specific | RISK_VOCABULARY:
+        tf = counts[term] * 1000 / len(words)
+        score += (2 if term in specific else 1) * math.log1p(tf)
+    return score
+
+
+def subject_coverage(words: list[str], subject: str) -> float:
+    """
+    Part des termes du type de document (hors mots outils) présents dans le texte : 1.0 si tous y figurent.
+    """
+    terms = {w for w in tokenize(subject) if len(w) > 2 and w not in FRENCH_COMMON_WORDS}
+    if not terms:
+        return 0.0
+    present = set(words)
+    return sum(1 for term in terms if term in present) / len(terms)
+
+
+def local_relevance(text: str, subject: str, keywords: list[str] | None = None) -> tuple[bool | None, dict]:
+    """
+    Pré-filtre local de pertinence d'un document, sans appel au LLM.
+
+    :param text: Texte (ou extrait) du document.
+    :param subject: Type de document recherché (DICRIM, PLU, SRADDET...).
+    :param keywords: Termes supplémentaires, par exemple les risques demandés.
+
+    :return: True / False si les heuristiques sont concluantes, None si le document doit être vérifié par le LLM, et les scores calculés.
+        True suppose que tous les termes du type de document figurent dans le texte, un document ne parlant que
+        de risques en général est vérifié par le LLM.
+    """
+    words = tokenize(text)
+    verdict, scores = gibberish_verdict(text, words)
+    scores["gibberish"] = verdict
+    scores["topic"] = topic_score(words, subject, keywords)
+    scores["subject"] = subject_coverage(words, subject)
+
+    if verdict == "gibberish":
+        decision = False
+    elif verdict == "borderline":
+        decision = None
+    elif scores["topic"] >= TOPIC_SCORE_RELEVANT and scores["subject"] == 1.0:
+        # le vocabulaire des risques ne suffit pas : le document doit nommer le type de document recherché
+        decision = True
+    elif scores["topic"] < TOPIC_SCORE_NOT_RELEVANT:
+        decision = False
+    else:
+        decision = None
+
+    # toujours affiché, pour pouvoir ajuster les seuils à partir des décisions réelles
+    print(f"local relevance {subject} {decision} {scores}")
+    return decision, scores
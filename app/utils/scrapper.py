@@ -1,36 +1,118 @@
-import requests
 from difflib import SequenceMatcher
 import fitz
 import app.utils.bedrock as bedrock
-import io
+import hashlib
+import os
+import tempfile
 from googleapiclient.discovery import build
-import json
-import pandas as pd
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, CancelledError
+from app.utils.pdf import get_extraction_pool, iter_pages, pages_to_text, DEFAULT_MAX_CHARS
+from app.utils.pdf_cache import PdfCache
+from app.utils.gazetteer import get_gazetteer, normalize_name
+from app.utils.cache import ResponseCache, MemoryCache
+from app.utils.http import HttpClient, get_http_client
+from app.utils.catnat import CatnatCache, CatnatStore, typed_catnat_frame
+from app.utils.relevance import local_relevance
+
+CATNAT_URL = "https://georisques.gouv.fr/api/v1/gaspar/catnat"
+# type de document du rapport Géorisques de la commune, ajouté à chaque recherche
+GEORISQUES_REPORT = "Rapport Géorisques"
+
+# résolutions commune -> code INSEE -> coordonnées partagées par le processus
+GEO_CACHE = MemoryCache(maxsize=4096, ttl=24 * 3600)
 
 
 class scrapper:
-    def __init__(self, num_results=1, pipe=None, googlecred=None, googleidengin=None):
+    def __init__(self, num_results=1, pipe=None, googlecred=None, googleidengin=None, max_workers=8, pdf_cache: PdfCache | None = None,
+                 http: HttpClient | None = None, catnat_cache: CatnatCache | None = None,
+                 catnat_store: CatnatStore | None = None, bedrockapi: bedrock.WrapperBedrock | None = None):
         self.num_results = num_results
         self.pipe = pipe
         self.cred = googlecred
         self.idengin = googleidengin
-    
+        self.max_workers = max_workers
+        self.pdf_cache = pdf_cache
+        # client partagé : connexions réutilisées, délais d'attente et nouvelles tentatives
+        self.http = http if http is not None else get_http_client()
+        self.catnat_cache = catnat_cache if catnat_cache is not None else CatnatCache()
+        # base CATNAT nationale locale : si configurée, l'API Géorisques n'est plus appelée
+        self.catnat_store = catnat_store
+        # résolutions géographiques mémorisées pour la durée d'un planning
+        self.geo_memo = {}
+        # client Bedrock réutilisé par toutes les vérifications de pertinence
+        self.bedrockapi = bedrockapi
+
+    def reset(self):
+        """
+        Oublie les résolutions géographiques mémorisées pour le planning en cours.
+        """
+        self.geo_memo = {}
+
+    def _memoized(self, kind, key, compute, valid):
+        """
+        Résout `key` en passant par la mémoire du planning puis par le cache du processus.
+        Seuls les résultats valides (selon `valid`) sont mis en cache.
+        """
+        memo_key = ResponseCache.make_key(kind, key)
+        if memo_key in self.geo_memo:
+            return self.geo_memo[memo_key]
+        value = GEO_CACHE.get(memo_key)
+        if value is None:
+            value = compute()
+            if not valid(value):
+                return value
+            GEO_CACHE.set(memo_key, value)
+        self.geo_memo[memo_key] = value
+        return value
+
+    def fetch_catnat(self, code_insee, page_size=256):
+        """
+        Récupère toutes les pages des arrêtés CATNAT d'une commune, les pages suivant la première étant récupérées en parallèle.
+        """
+        def fetch_page(page):
+            response = self.http.get(
+                f"{CATNAT_URL}?rayon=2500&code_insee={code_insee}&page={page}&page_size={page_size}")
+            response.raise_for_status()
+            return response.json()
+
+        first = fetch_page(1)
+        data = list(first["data"])
+        total_pages = first.get("total_pages") or 1
+        if total_pages > 1:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, total_pages - 1)) as pool:
+                for page in pool.map(fetch_page, range(2, total_pages + 1)):
+                    data.extend(page["data"])
+        return data
+
     def get_accident_history(self,city,v=False):
         code_insee = self.get_insee_code(city)
         if(v):
             print(code_insee)
         try:
-            response = requests.get(f"https://georisques.gouv.fr/api/v1/gaspar/catnat?rayon=2500&code_insee={code_insee}&page=1&page_size=256", stream=True)
-            text = json.loads(response.content)
-            data = text["data"]
-            df = pd.json_normalize(data)
-            return {"url": f"https://georisques.gouv.fr/api/v1/gaspar/catnat?rayon=2500&code_insee={code_insee}&page=1&page_size=256", "df": df}
+            if self.catnat_store is not None:
+                return {"url": f"file://{os.path.abspath(self.catnat_store.path)}?code_insee={code_insee}", "df": self.catnat_store.query(code_insee)}
+            df = self.catnat_cache.read(code_insee)
+            if df is None:
+                df = typed_catnat_frame(self.fetch_catnat(code_insee))
+                self.catnat_cache.write(code_insee, df)
+            return {"url": f"{CATNAT_URL}?rayon=2500&code_insee={code_insee}", "df": df}
         except Exception as e:
             if(v):
                 print(f"error {e}")
             return None
     
-    def get_insee_code(self,city_name):
+    def get_insee_code(self, city_name):
+        return self._memoized("insee", normalize_name(city_name), lambda: self._get_insee_code(city_name),
+                              lambda code: code not in (None, "City not found", "Error fetching data"))
+
+    def _get_insee_code(self,city_name):
+        # table locale des communes, sans appel réseau
+        gazetteer = get_gazetteer()
+        if gazetteer is not None:
+            commune = gazetteer.lookup(city_name)
+            return commune["code"] if commune else "City not found"
+
         def similarity(a, b):
             return SequenceMatcher(None, a, b).ratio()
 
@@ -47,7 +129,7 @@ class scrapper:
             return best_match
 
         url = f"https://geo.api.gouv.fr/communes?nom={city_name}&fields=code"
-        response = requests.get(url)
+        response = self.http.get(url)
 
         if response.status_code == 200:
             data = response.json()
@@ -60,8 +142,17 @@ class scrapper:
 
 
     def get_city_coordinates(self, insee_code):
+        return self._memoized("coordinates", insee_code, lambda: self._get_city_coordinates(insee_code),
+                              lambda coordinates: "error" not in coordinates)
+
+    def _get_city_coordinates(self, insee_code):
+        gazetteer = get_gazetteer()
+        commune = gazetteer.by_code(insee_code) if gazetteer is not None else None
+        if commune is not None and commune["latitude"] is not None:
+            return {"city": commune["nom"], "longitude": commune["longitude"], "latitude": commune["latitude"]}
+
         url = f"https://geo.api.gouv.fr/communes/{insee_code}?fields=nom,centre"
-        response = requests.get(url)
+        response = self.http.get(url)
         if response.status_code == 200:
             data = response.json()
             lon, lat = data["centre"]["coordinates"]
@@ -69,11 +160,9 @@ class scrapper:
         else:
             return {"error": "City not found"}
 
-    def pdf_to_text(self, pdf_path):
-        doc = fitz.open(pdf_path)
-        text = "\n".join(page.get_text("text")
-                         for page in doc)  # Extract text only
-        return text
+    def pdf_to_text(self, pdf_path, max_chars=DEFAULT_MAX_CHARS):
+        with fitz.open(pdf_path) as doc:
+            return pages_to_text(iter_pages(doc, max_chars=max_chars))  # Extract text only
 
     def word_count(self, text):
         words = text.split()  # Split text by whitespace
@@ -88,19 +177,19 @@ class scrapper:
         if (v):
             print(code_insee)
         try:
-            response = requests.get(f"https://georisques.gouv.fr/api/v1/rapport_pdf?code_insee={code_insee}", stream=True)
-            if response.status_code != 200 or not response.content.startswith(b"%PDF"):
-                raise ValueError("Invalid or corrupt PDF file.")
-            
-            pdf_document = fitz.open("pdf", io.BytesIO(response.content))
-            text = "\n".join([page.get_text() for page in pdf_document])
-            return {"url": f"https://georisques.gouv.fr/api/v1/rapport_pdf?code_insee={code_insee}", "pdf": text}
+            url = f"https://georisques.gouv.fr/api/v1/rapport_pdf?code_insee={code_insee}"
+            return {"url": url, "pdf": self.fetch_pdf_text(url), "doc": GEORISQUES_REPORT}
         except Exception as e:
             if(v):
                 print(f"error {e}")
             return None
     
-    def check_revelence(self,subject,pathpdf,logs=False,v=False):
+    def get_bedrock(self) -> bedrock.WrapperBedrock:
+        if self.bedrockapi is None:
+            self.bedrockapi = bedrock.WrapperBedrock()
+        return self.bedrockapi
+
+    def check_revelence(self,subject,pathpdf,logs=False,v=False,keywords=None):
         if(v):
             print(f"checking revelence...")
         text = pathpdf
@@ -108,10 +197,15 @@ class scrapper:
             if (v):
                 print("not enough words, bailout")
             return False
+        # heuristiques locales d'abord, seuls les cas limites sont soumis au LLM
+        decision, scores = local_relevance(
+            self.truncate_string(text, 2000), subject, keywords)
+        if decision is not None:
+            return decision
         sample = self.truncate_string(text, 10)
         messages = [bedrock.ConverseMessage.make_user_message(
             f"tu vas recevoir un echantillons de text et tu devra me dire seulement \"Oui\" ou \"Non\" si le text est du non sens tel que par exemple <wsefwsefgvygf \n\n voici l'echantillons: {sample}")]
-        bedrockapi = bedrock.WrapperBedrock()
+        bedrockapi = self.get_bedrock()
         outputs = bedrockapi.converse(self.pipe, messages, 4, 0)
         if (v):
             print(outputs.content[0].text)
@@ -136,7 +230,90 @@ class scrapper:
                 print("found revelent")
             return True
 
-    def find_doc(self, region: str, documents: list, v=False, logs=False) -> list:
+    def download_pdf(self, url, file, cancel=None, headers=None):
+        """
+        Télécharge un PDF par morceaux directement dans `file`, sans le garder en mémoire.
+
+        La signature `%PDF` est vérifiée dès les premiers octets reçus : une page HTML ou un autre contenu est
+        abandonné sans être téléchargé. Le téléchargement est aussi abandonné si `cancel` est levé entre deux morceaux.
+
+        :param file: Fichier binaire ouvert en écriture.
+        :return: Le hash SHA-256 du PDF (None si le serveur répond 304 à une requête conditionnelle) et les en-têtes de la réponse.
+        """
+        digest = hashlib.sha256()
+        head = b""
+        with self.http.get(url, stream=True, headers=headers) as response:
+            if response.status_code == 304:
+                return None, response.headers
+            if response.status_code != 200:
+                raise ValueError("Invalid or corrupt PDF file.")
+            for chunk in self.http.iter_content(response):
+                if cancel is not None and cancel.is_set():
+                    raise CancelledError(f"download of {url} cancelled")
+                if len(head) < 4:
+                    head += chunk[:4]
+                    if len(head) >= 4 and not head.startswith(b"%PDF"):
+                        raise ValueError("Invalid or corrupt PDF file.")
+                digest.update(chunk)
+                file.write(chunk)
+        if not head.startswith(b"%PDF"):
+            raise ValueError("Invalid or corrupt PDF file.")
+        return digest.hexdigest(), response.headers
+
+    def fetch_pdf_text(self, url, cancel=None) -> str:
+        """
+        Récupère le texte d'un PDF en évitant le téléchargement et l'extraction s'il est déjà dans le cache local.
+
+        Le PDF est téléchargé dans un fichier temporaire ouvert directement par PyMuPDF puis déplacé dans le cache :
+        la mémoire utilisée par un téléchargement est bornée à un morceau, quelle que soit la taille du document.
+        """
+        cache = self.pdf_cache
+        entry = cache.lookup(url) if cache is not None else None
+        if entry is not None:
+            text = cache.read_text(entry["sha256"]) if cache.is_fresh(entry) else None
+            if text is not None:
+                return text
+
+        file = cache.temp_file() if cache is not None else tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        try:
+            with file:
+                sha256, headers = self.download_pdf(
+                    url, file, cancel, cache.revalidation_headers(entry) if cache is not None else None)
+            if sha256 is None:
+                # 304 : le PDF n'a pas changé depuis sa mise en cache
+                text = cache.read_text(entry["sha256"])
+                if text is not None:
+                    cache.touch(url)
+                    return text
+                with open(file.name, "wb") as f:
+                    sha256, headers = self.download_pdf(url, f, cancel)
+
+            text = cache.read_text(sha256) if cache is not None else None
+            if text is None:
+                # extraction dans un processus séparé pour ne pas bloquer sur le GIL
+                text = get_extraction_pool().extract_file_text(file.name)
+            if cache is not None:
+                cache.put_file(url, file.name, sha256, text, etag=headers.get("ETag"),
+                               last_modified=headers.get("Last-Modified"))
+            return text
+        finally:
+            if os.path.exists(file.name):
+                os.remove(file.name)
+
+    def fetch_relevant_doc(self, url, document, cancel, v=False, logs=False, keywords=None):
+        """
+        Télécharge, extrait puis vérifie la pertinence d'un PDF.
+
+        :return: Le document ({"url", "pdf", "doc"}) s'il est pertinent, None sinon.
+        """
+        text = self.fetch_pdf_text(url, cancel)
+        if cancel.is_set():
+            return None
+        if self.check_revelence(document, text, v=v, logs=logs, keywords=keywords):
+            return {"url": url, "pdf": text, "doc": document}
+        return None
+
+    def find_doc(self, region: str, documents: list, v=False, logs=False, keywords=None) -> list:
         files = []
         for document in documents:
             query = f'{region} {document} "{document}" filetype:pdf'
@@ -153,28 +330,29 @@ class scrapper:
                 .execute()
             )
             results = [link["link"] for link in res["items"]]
+
+            # téléchargements, extractions et vérifications en parallèle, arrêt dès que assez de documents pertinents sont trouvés
+            cancel = threading.Event()
+            pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            futures = [pool.submit(self.fetch_relevant_doc, result, document, cancel, v, logs, keywords)
+                       for result in results if result.endswith(".pdf")]
             counter_result = 0
-            for result in results:
-                if result.endswith(".pdf"):
+            try:
+                for future in as_completed(futures):
                     try:
-                        response = requests.get(result, stream=True)
-                        if response.status_code != 200 or not response.content.startswith(b"%PDF"):
-                            raise ValueError("Invalid or corrupt PDF file.")
-
-                        pdf_document = fitz.open(
-                            "pdf", io.BytesIO(response.content))
-                        text = "\n".join([page.get_text()
-                                         for page in pdf_document])
-                        stat = self.check_revelence(
-                            document, text, v=v, logs=logs)
-                        if (stat):
-                            files.append({"url": result, "pdf": text})
-                            counter_result += 1
-                        if (counter_result >= self.num_results):
-                            break
+                        found = future.result()
                     except Exception as e:
-                        if(v):
+                        if (v):
                             print(f"error {e}")
+                        continue
+                    if found:
+                        files.append(found)
+                        counter_result += 1
+                    if (counter_result >= self.num_results):
+                        break
+            finally:
+                cancel.set()
+                pool.shutdown(wait=False, cancel_futures=True)
         return files
 
 # import torch
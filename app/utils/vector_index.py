@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+import numpy as np
+from .bedrock import cosine_similarity
+
+
+class VectorIndex:
+    def __init__(self, directory: str = ".cache/index", max_age: float = 30 * 24 * 3600):
+        """
+        Index local et persistant des documents analysés, de leurs passages et de leurs embeddings.
+
+        Les métadonnées (URL, code INSEE de la commune, passages, analyses par liste de risques) sont stockées dans SQLite,
+        les embeddings dans un fichier float32 brut lu par memory-map, la ligne d'un passage étant son identifiant SQLite.
+
+        :param directory: Dossier de l'index.
+        :param max_age: Durée (en secondes) au-delà de laquelle les documents d'une commune sont recherchés à nouveau.
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.embeddings_path = os.path.join(directory, "embeddings.f32")
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS documents (url TEXT PRIMARY KEY, insee TEXT, text TEXT NOT NULL, added_at REAL NOT NULL)")
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS documents_insee ON documents (insee)")
+            # les index créés avant l'ajout du type de document n'ont pas la colonne doc_type
+            if "doc_type" not in [row[1] for row in db.execute("PRAGMA table_info(documents)")]:
+                db.execute("ALTER TABLE documents ADD COLUMN doc_type TEXT")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, url TEXT NOT NULL, chunk TEXT NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS chunks_url ON chunks (url)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS analyses (url TEXT NOT NULL, risks TEXT NOT NULL, analysis TEXT NOT NULL, PRIMARY KEY (url, risks))")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=30)
+
+    @staticmethod
+    def risks_key(risks: list[str] | None) -> str:
+        """
+        Clé d'une liste de risques, indépendante de l'ordre, de la casse et des doublons.
+        """
+        return json.dumps(sorted({r.strip().lower() for r in risks or []}), ensure_ascii=False)
+
+    def _dimension(self, db: sqlite3.Connection) -> int | None:
+        row = db.execute(
+            "SELECT value FROM meta WHERE key = 'dimension'").fetchone()
+        return None if row is None else int(row[0])
+
+    def _embeddings(self, db: sqlite3.Connection) -> np.ndarray:
+        dimension = self._dimension(db)
+        if dimension is None or not os.path.exists(self.embeddings_path) or os.path.getsize(self.embeddings_path) == 0:
+            return np.empty((0, dimension or 0), dtype=np.float32)
+        rows = os.path.getsize(self.embeddings_path) // (4 * dimension)
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(rows, dimension))
+
+    def add_document(self, url: str, insee: str | None, text: str, doc_type: str | None = None) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO documents (url, insee, text, added_at, doc_type) VALUES (?, ?, ?, ?, ?)",
+                       (url, insee, text, time.time(), doc_type))
+
+    def documents_for(self, insee: str, doc_types: list[str] | None = None) -> list[dict]:
+        """
+        Documents récents déjà trouvés pour une commune, au format de SEARCH_DOCS ({"url", "pdf", "doc", "insee"}).
+
+        :param doc_types: Types de documents recherchés (DICRIM, PLU...), tous les types si None.
+        """
+        query = "SELECT url, text, doc_type FROM documents WHERE insee = ? AND added_at > ?"
+        params = [insee, time.time() - self.max_age]
+        if doc_types is not None:
+            query += " AND doc_type IN ({})".format(", ".join("?" * len(doc_types)))
+            params += list(doc_types)
+        with closing(self._connect()) as db, db:
+            rows = db.execute(query, params).fetchall()
+        return [{"url": url, "pdf": text, "doc": doc_type, "insee": insee} for url, text, doc_type in rows]
+
+    def add_chunks(self, url: str, chunks: list[str], embeddings: np.ndarray) -> None:
+        """
+        Ajoute les passages d'un document et leurs embeddings (matrice (len(chunks), dimension)).
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self.lock, closing(self._connect()) as db, db:
+            dimension = self._dimension(db)
+            if dimension is None:
+                db.execute("INSERT INTO meta (key, value) VALUES ('dimension', ?)",
+                           (str(embeddings.shape[1]),))
+            elif dimension != embeddings.shape[1]:
+                raise ValueError(
+                    f"Dimension d'embedding invalide : {embeddings.shape[1]}, attendu : {dimension}")
+
+            # les identifiants des passages suivent les lignes du fichier d'embeddings
+            first_id = len(self._embeddings(db))
+            db.execute("DELETE FROM chunks WHERE url = ?", (url,))
+            db.executemany("INSERT INTO chunks (id, url, chunk) VALUES (?, ?, ?)",
+                           [(first_id + i, url, chunk) for i, chunk in enumerate(chunks)])
+            with open(self.embeddings_path, "ab") as f:
+                f.write(embeddings.tobytes())
+
+    def get_chunks(self, url: str) -> tuple[list[str], np.ndarray] | None:
+        """
+        Passages d'un document et leurs embeddings, ou None si le document n'a pas été encodé.
+        """
+        with closing(self._connect()) as db, db:
+            rows = db.execute(
+                "SELECT id, chunk FROM chunks WHERE url = ? ORDER BY id", (url,)).fetchall()
+            if not rows:
+                return None
+            embeddings = self._embeddings(db)
+        return [chunk for _, chunk in rows], np.asarray(embeddings[[i for i, _ in rows]])
+
+    def add_analysis(self, url: str, risks: list[str] | None, analysis: dict) -> None:
+        with closing(self._connect()) as db, db:
+            db.execute("INSERT OR REPLACE INTO analyses (url, risks, analysis) VALUES (?, ?, ?)",
+                       (url, self.risks_key(risks), json.dumps(analysis, ensure_ascii=False)))
+
+    def get_analysis(self, url: str, risks: list[str] | None) -> dict | None:
+        """
+        Analyse déjà faite d'un document pour la même liste de risques, ou None.
+        """
+        with closing(self._connect()) as db, db:
+            row = db.execute("SELECT analysis FROM analyses WHERE url = ? AND risks = ?",
+                             (url, self.risks_key(risks))).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def search(self, query: np.ndarray, insee: str | None = None, top_k: int = 10) -> list[dict]:
+        """
+        Recherche les passages les plus proches d'un embedding, éventuellement restreinte aux documents d'une commune.
+
+        :return: Liste de {"url", "chunk", "score"} triée par score décroissant.
+        """
+        with closing(self._connect()) as db, db:
+            if insee is None:
+                rows = db.execute("SELECT id, url, chunk FROM chunks").fetchall()
+            else:
+                rows = db.execute("SELECT c.id, c.url, c.chunk FROM chunks c JOIN documents d ON d.url = c.url WHERE d.insee = ?",
+                                  (insee,)).fetchall()
+            embeddings = self._embeddings(db)
+        if not rows:
+            return []
+
+        scores = cosine_similarity(
+            query, np.asarray(embeddings[[row[0] for row in rows]]))
+        best = np.argsort(scores)[::-1][:top_k]
+        return [{"url": rows[i][1], "chunk": rows[i][2], "score": float(scores[i])} for i in best]
@@ -1,3 +1,4 @@
+import os
 import time
 import pandas as pd
 import streamlit as st
@@ -10,21 +11,33 @@ import folium
 import streamlit_folium as stf
 
 from app.utils.bedrock import WrapperBedrock
+from app.utils.cache import SQLiteCache
+from app.utils.ratelimit import TokenBucket
+from app.utils.vector_index import VectorIndex
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# mode de planification (voir plan_actions) : "fast" (planning canonique sans LLM), "single" (un seul appel) ou "llm"
+PLANNING_MODE = os.environ.get("PLANNING_MODE", "fast")
+
 st.set_page_config(layout="wide")
 st.image("sfil.png", width=100)
 
 @st.cache_resource
 def get_bedrock() -> WrapperBedrock:
-    return WrapperBedrock()
+    # les réponses sont conservées une semaine pour ne pas repayer les prompts identiques
+    # un limiteur pour toutes les requêtes Converse et un pour les embeddings, afin de ne pas dépasser les quotas Bedrock
+    # (requêtes / seconde) quand plusieurs documents sont analysés en parallèle
+    return WrapperBedrock(cache=SQLiteCache(".cache/bedrock.sqlite", ttl=7 * 24 * 3600),
+                          rate_limiter=TokenBucket(rate=1, capacity=4),
+                          embedding_rate_limiter=TokenBucket(rate=20, capacity=40))
 
 
 @st.cache_resource
 def get_agent_context() -> AgentContext:
-    ag = AgentContext(get_bedrock())
+    ag = AgentContext(get_bedrock(), stream=True,
+                      index=VectorIndex(".cache/index"))
     ag.register_task(search_docs)
     ag.register_task(analyze_documents)
     ag.register_task(dataviz)
@@ -71,7 +84,8 @@ if prompt:
 
     # récupération du planning de l'agent
     planning = plan_actions(get_bedrock(), validation_model_id="mistral.mistral-large-2407-v1:0",
-                            planning_model_id="mistral.mistral-large-2407-v1:0", user_request=prompt)
+                            planning_model_id="mistral.mistral-large-2407-v1:0", user_request=prompt,
+                            mode=PLANNING_MODE)
 
     if "error" in planning:
         execution_status.update(state="error")
@@ -95,8 +109,16 @@ if prompt:
         "dataviz_output") if "dataviz_output" in exec.outputs else None
 
     if "synthesize_output" in exec.outputs:
+        synthesis = exec.get_inputs("synthesize_output")
+        if isinstance(synthesis, str):
+            bot_reply.write(synthesis)
+        else:
+            # affichage progressif de la synthèse pendant sa génération
+            synthesis = bot_reply.write_stream(synthesis)
+            exec.outputs["synthesize_output"] = synthesis
+
         msg = {"role": "assistant",
-               "content": exec.get_inputs("synthesize_output")}
+               "content": synthesis}
         if viz:
             if isinstance(viz, folium.Map):
                 msg["embed"] = viz
@@ -104,7 +126,6 @@ if prompt:
                 msg["fig"] = viz
 
         st.session_state["messages"].append(msg)
-        bot_reply.write(exec.get_inputs("synthesize_output"))
 
         if viz:
             with bot_reply:
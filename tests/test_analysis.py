@@ -0,0 +1,39 @@
+from app.analysis import analyze_doc_risks
+
+
+class FakeBedrock:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def converse_raw(self, model_id, messages, max_tokens, tool_config=None, **kwargs):
+        self.calls.append(tool_config)
+        return self.responses.pop(0)
+
+
+def response(content, stop_reason="end_turn"):
+    return {"output": {"message": {"content": content}}, "stopReason": stop_reason}
+
+
+RISK = '{"nom_risque": "Inondation", "identification_risque": "PPRI", "plan_adaptation_risque": null}'
+
+
+def test_truncated_structured_analysis_is_recovered():
+    truncated = '{"risques": [' + RISK + ', {"nom_risque": "Sécheresse", "identification'
+    bedrock = FakeBedrock([response([{"toolUse": {"input": truncated}}], "max_tokens")])
+
+    out = analyze_doc_risks(bedrock, "doc", "https://a/dicrim.pdf", "model", ["Inondation"])
+    assert [r.nom_risque for r in out.risques] == ["Inondation"]
+    assert out.url == "https://a/dicrim.pdf"
+    assert len(bedrock.calls) == 1
+
+
+def test_invalid_structured_analysis_falls_back_to_text():
+    bedrock = FakeBedrock([
+        response([{"toolUse": {"input": {"risques": "aucun"}}}]),
+        response([{"text": '{"risques": [' + RISK + '], "note": 7, "explication": "ok"}'}]),
+    ])
+
+    out = analyze_doc_risks(bedrock, "doc", "https://a/dicrim.pdf", "model", ["Inondation"])
+    assert out.note == 7
+    assert bedrock.calls[0] is not None and bedrock.calls[1] is None
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from app.planning.executor import AgentContext, agent_task
+from app.planning.subtasks import SubTask
+from app.utils.bedrock import AsyncWrapperBedrock
+
+
+@agent_task("ASYNC_WAIT")
+async def async_wait(exec: AgentContext, args: dict) -> str:
+    # ne se termine que si toutes les sous-tâches du groupe sont attendues en même temps
+    exec.arrived += 1
+    if exec.arrived == args["group"]:
+        exec.all_arrived.set()
+    await asyncio.wait_for(exec.all_arrived.wait(), timeout=5)
+    return args["name"]
+
+
+@agent_task("UPPER")
+def upper(exec: AgentContext, args: dict) -> str:
+    return exec.get_inputs(args["in"]).upper()
+
+
+def make_context() -> AgentContext:
+    exec = AgentContext(None)
+    exec.register_task(async_wait)
+    exec.register_task(upper)
+    exec.arrived = 0
+    return exec
+
+
+def make_tasks() -> list[SubTask]:
+    return [
+        SubTask(task="ASYNC_WAIT", description="a", args={"name": "a", "group": 2}, out="a"),
+        SubTask(task="ASYNC_WAIT", description="b", args={"name": "b", "group": 2}, out="b"),
+        SubTask(task="UPPER", description="majuscules", args={"in": "a"}, out="upper"),
+    ]
+
+
+def test_execute_tasks_async_awaits_coroutine_tasks_concurrently():
+    exec = make_context()
+
+    async def run() -> list[str]:
+        exec.all_arrived = asyncio.Event()
+        return [description async for description in exec.execute_tasks_async(make_tasks())]
+
+    assert sorted(asyncio.run(run())) == ["a", "b", "majuscules"]
+    assert exec.outputs["upper"] == "A"
+
+
+async def make_event() -> asyncio.Event:
+    return asyncio.Event()
+
+
+def test_execute_tasks_runs_coroutine_tasks_on_one_shared_loop():
+    exec = make_context()
+    loop = exec.event_loop()
+    # l'événement est créé sur la boucle partagée où s'exécutent les tâches coroutines
+    exec.all_arrived = asyncio.run_coroutine_threadsafe(make_event(), loop).result()
+
+    assert sorted(exec.execute_tasks(make_tasks())) == ["a", "b", "majuscules"]
+    assert exec.outputs["upper"] == "A"
+    assert exec.event_loop() is loop
+
+
+class SlowWrapper:
+    def __init__(self):
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def converse(self, model_id, messages, max_tokens, temperature, use_cache, **kwargs):
+        self.barrier.wait()
+        return model_id
+
+    def get_embedding(self, text, embed_model_id):
+        self.barrier.wait()
+        return text
+
+
+def test_async_wrapper_runs_calls_concurrently():
+    bedrock = AsyncWrapperBedrock(SlowWrapper())
+
+    async def run():
+        return await asyncio.gather(bedrock.converse("model", []), bedrock.get_embedding("texte"))
+
+    assert asyncio.run(run()) == ["model", "texte"]
@@ -0,0 +1,105 @@
+import pytest
+from app.utils.bedrock import WrapperBedrock, ConverseMessage
+from app.utils.cache import ResponseCache, MemoryCache, SQLiteCache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    return MemoryCache(ttl=60) if request.param == "memory" else SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=60)
+
+
+def test_cache_get_set(cache):
+    key = ResponseCache.make_key("model", {"b": 1, "a": 2})
+    assert key == ResponseCache.make_key("model", {"a": 2, "b": 1})
+    assert cache.get(key) is None
+    cache.set(key, {"text": "réponse"})
+    assert cache.get(key) == {"text": "réponse"}
+    cache.set("expired", "valeur", ttl=-1)
+    assert cache.get("expired") is None
+    assert cache.stats() == {"hits": 1, "misses": 2}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_response_cache_is_abstract():
+    with pytest.raises(TypeError):
+        ResponseCache()
+
+
+class FakeClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def converse(self, **request):
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+def fake_bedrock(responses):
+    bedrock = WrapperBedrock.__new__(WrapperBedrock)
+    bedrock.bedrock = FakeClient(responses)
+    bedrock.cache = MemoryCache()
+    bedrock.rate_limiter = None
+    bedrock.embedding_cache = MemoryCache()
+    bedrock.embedding_rate_limiter = None
+    return bedrock
+
+
+def response(text, stop_reason="end_turn"):
+    return {"output": {"message": {"role": "assistant", "content": [{"text": text}]}}, "stopReason": stop_reason}
+
+
+@pytest.mark.parametrize("first", [response("coupé", "max_tokens"), response(""), response("filtré", "content_filtered")])
+def test_converse_does_not_cache_incomplete_responses(first):
+    bedrock = fake_bedrock([first, response("complet")])
+    messages = [ConverseMessage.make_user_message("question")]
+
+    assert bedrock.converse_raw("model", messages) == first
+    assert bedrock.converse_raw("model", messages)["output"]["message"]["content"][0]["text"] == "complet"
+    assert bedrock.converse_raw("model", messages)["output"]["message"]["content"][0]["text"] == "complet"
+    assert bedrock.bedrock.calls == 2
+
+
+def test_converse_does_not_cache_sampled_responses():
+    bedrock = fake_bedrock([response("a"), response("b")])
+    messages = [ConverseMessage.make_user_message("question")]
+
+    assert bedrock.converse_raw("model", messages, temperature=0.7) != bedrock.converse_raw("model", messages, temperature=0.7)
+
+
+class FakeStreamClient:
+    def __init__(self, chunks, stop_reason):
+        self.chunks = chunks
+        self.stop_reason = stop_reason
+        self.calls = 0
+
+    def converse_stream(self, **request):
+        self.calls += 1
+        events = [{"contentBlockDelta": {"delta": {"text": chunk}}} for chunk in self.chunks]
+        return {"stream": events + [{"messageStop": {"stopReason": self.stop_reason}}]}
+
+
+@pytest.mark.parametrize("stop_reason, cached", [("end_turn", True), ("max_tokens", False)])
+def test_converse_stream_caches_complete_responses(stop_reason, cached):
+    bedrock = fake_bedrock([])
+    bedrock.bedrock = FakeStreamClient(["Bonjour", " !"], stop_reason)
+    messages = [ConverseMessage.make_user_message("question")]
+
+    assert "".join(bedrock.converse_stream("model", messages)) == "Bonjour !"
+    assert "".join(bedrock.converse_stream("model", messages)) == "Bonjour !"
+    assert bedrock.bedrock.calls == (1 if cached else 2)
+
+
+def test_converse_stream_validates_arguments_eagerly():
+    bedrock = fake_bedrock([])
+    with pytest.raises(ValueError):
+        bedrock.converse_stream("model", [ConverseMessage.make_user_message("question")], max_tokens=0)
@@ -0,0 +1,47 @@
+import pandas as pd
+from app.utils.catnat import CatnatCache, CatnatStore
+
+
+def write_csv(path, rows, columns):
+    pd.DataFrame(rows, columns=columns).to_csv(path, sep=";", index=False)
+
+
+def test_ingest_gaspar_csv(tmp_path):
+    csv = tmp_path / "catnat.csv"
+    write_csv(csv, [
+        ["INTE0001", "02408", "Laon", "Inondations et coulées de boue", "01/06/2016", "02/06/2016", "10/07/2016", "12/07/2016"],
+        ["INTE0002", "02408", "Laon", "Sécheresse", "01/07/2019", "30/09/2019", "15/05/2020", "17/05/2020"],
+        ["INTE0003", "75056", "Paris", "Inondations et coulées de boue", "28/05/2016", "05/06/2016", "08/06/2016", "09/06/2016"],
+    ], ["cod_nat_catnat", "cod_commune", "lib_commune", "lib_risque_jo", "dat_deb", "dat_fin", "dat_pub_arrete", "dat_pub_jo"])
+    store = CatnatStore(str(tmp_path / "catnat.sqlite"))
+
+    assert store.ingest_csv(str(csv)) == 3
+    laon = store.query("02408")
+    assert list(laon["code_national_catnat"]) == ["INTE0001", "INTE0002"]
+    assert laon["date_debut_evt"].iloc[0] == pd.Timestamp("2016-06-01")
+    assert len(store.query(["02408", "75056"], start="2016-01-01", end="2016-12-31")) == 2
+    counts = store.aggregate(["02408", "75056"]).set_index("libelle_risque_jo")["nombre_arretes"]
+    assert counts["Inondations et coulées de boue"] == 2
+
+
+def test_ingest_csv_without_date_column(tmp_path):
+    csv = tmp_path / "catnat.csv"
+    write_csv(csv, [["INTE0001", "02408", "Laon", "Sécheresse", "01/07/2019", "30/09/2019", "15/05/2020"]],
+              ["cod_nat_catnat", "cod_commune", "lib_commune", "lib_risque_jo", "dat_deb", "dat_fin", "dat_pub_arrete"])
+    store = CatnatStore(str(tmp_path / "catnat.sqlite"))
+
+    assert store.ingest_csv(str(csv)) == 1
+    row = store.query("02408").iloc[0]
+    assert row["date_debut_evt"] == pd.Timestamp("2019-07-01")
+    assert pd.isna(row["date_publication_jo"])
+
+
+def test_cache_creates_its_directory_on_first_write(tmp_path):
+    directory = tmp_path / "catnat"
+    cache = CatnatCache(str(directory))
+    assert not directory.exists()
+    assert cache.read("75056") is None
+    assert not directory.exists()
+
+    cache.write("75056", pd.DataFrame({"code_insee": ["75056"]}))
+    assert cache.read("75056")["code_insee"].tolist() == ["75056"]
@@ -0,0 +1,60 @@
+import threading
+from app.planning.executor import AgentContext, agent_task
+from app.planning.subtasks import SubTask
+
+
+def make_tasks():
+    return [
+        SubTask(task="PRODUCE", description="recherche", args={}, out="search_output"),
+        SubTask(task="DOUBLE", description="analyse", args={"in": "search_output"}, out="analyze_output"),
+        SubTask(task="DOUBLE", description="dataviz", args={"in": "analyze_output"}, out="dataviz_output"),
+        SubTask(task="CONCAT", description="synthèse", args={"in": "analyze_output", "dataviz": "dataviz_output"},
+                out="synthesize_output"),
+    ]
+
+
+@agent_task("PRODUCE")
+def produce(exec: AgentContext, args: dict) -> list:
+    return [1, 2]
+
+
+@agent_task("DOUBLE")
+def double(exec: AgentContext, args: dict) -> list:
+    return [x * 2 for x in exec.get_inputs(args["in"])]
+
+
+@agent_task("CONCAT")
+def concat(exec: AgentContext, args: dict) -> list:
+    return exec.get_inputs(args["in"]) + exec.get_inputs(args["dataviz"])
+
+
+def make_context(max_workers: int = 4) -> AgentContext:
+    exec = AgentContext(None, max_workers=max_workers)
+    for task in (produce, double, concat):
+        exec.register_task(task)
+    return exec
+
+
+def test_build_dependencies():
+    assert make_context().build_dependencies(make_tasks()) == {0: set(), 1: {0}, 2: {1}, 3: {1, 2}}
+
+
+def test_execute_tasks_follows_dependencies():
+    exec = make_context()
+    assert list(exec.execute_tasks(make_tasks())) == ["recherche", "analyse", "dataviz", "synthèse"]
+    assert exec.outputs["synthesize_output"] == [2, 4, 4, 8]
+
+
+def test_independent_tasks_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    @agent_task("WAIT")
+    def wait(exec: AgentContext, args: dict) -> str:
+        # ne se débloque que si les deux sous-tâches tournent en même temps
+        barrier.wait()
+        return args["name"]
+
+    exec = make_context(max_workers=2)
+    exec.register_task(wait)
+    tasks = [SubTask(task="WAIT", description=name, args={"name": name}, out=name) for name in ("a", "b")]
+    assert sorted(exec.execute_tasks(tasks)) == ["a", "b"]
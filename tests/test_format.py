@@ -0,0 +1,59 @@
+import json
+import pytest
+from jinja2 import Environment, DictLoader
+from pydantic import BaseModel
+from app.utils.format import JsonStreamParser, LazyBytecodeCache, parse_json_response
+
+
+class Risk(BaseModel):
+    nom: str
+
+
+RESPONSE = 'Voici l\'analyse : {"risques": [{"nom": "Inondation"}, {"nom": "Sécheresse"}], "note": 7} fin'
+
+
+def test_stream_parser_emits_items_as_they_complete():
+    parser = JsonStreamParser(Risk, key="risques")
+    items = []
+    for i in range(0, len(RESPONSE), 5):
+        items += parser.feed(RESPONSE[i:i + 5])
+    assert [item.nom for item in items] == ["Inondation", "Sécheresse"]
+    assert parser.complete
+    assert parser.result()["note"] == 7
+
+
+def test_stream_parser_incomplete_result_raises():
+    parser = JsonStreamParser(Risk, key="risques")
+    parser.feed(RESPONSE[:40])
+    assert not parser.complete
+    with pytest.raises(json.JSONDecodeError):
+        parser.result()
+
+
+@pytest.mark.parametrize("truncated, expected", [
+    ('{"risques": [{"nom": "Inondation"}, {"nom": "Séch', {"risques": [{"nom": "Inondation"}]}),
+    ('{"risques": [{"nom": "Inondation"}, {', {"risques": [{"nom": "Inondation"}]}),
+    ('{"risques": [{"nom": "Inondation"}], "note": 7, "details": {"a', {"risques": [{"nom": "Inondation"}], "note": 7}),
+    ('{"risques": [{"nom": "Inon', {}),
+    ('[[1, 2], [3', [[1, 2]]),
+])
+def test_stream_parser_partial_result_drops_incomplete_trailing_items(truncated, expected):
+    parser = JsonStreamParser()
+    parser.feed(truncated)
+    assert parser.result(partial=True) == expected
+
+
+def test_parse_json_response():
+    assert parse_json_response(RESPONSE)["note"] == 7
+    assert parse_json_response("```json\n[1, 2]\n```") == [1, 2]
+    with pytest.raises(json.JSONDecodeError):
+        parse_json_response("pas de JSON")
+
+
+def test_bytecode_cache_directory_is_created_on_first_dump(tmp_path):
+    directory = tmp_path / "jinja"
+    environment = Environment(loader=DictLoader({"prompt": "Bonjour {{ nom }}"}),
+                              bytecode_cache=LazyBytecodeCache(str(directory)))
+    assert not directory.exists()
+    assert environment.get_template("prompt").render(nom="Laon") == "Bonjour Laon"
+    assert len(list(directory.iterdir())) == 1
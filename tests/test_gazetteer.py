@@ -0,0 +1,36 @@
+from app.utils.gazetteer import Gazetteer, normalize_name
+
+COMMUNES = [
+    {"nom": "Laon", "code": "02408", "centre": {"coordinates": [3.62, 49.56]}, "codeDepartement": "02",
+     "codeRegion": "32", "population": 24000},
+    {"nom": "Saint-Étienne", "code": "42218", "centre": {"coordinates": [4.39, 45.43]}, "codeDepartement": "42",
+     "codeRegion": "84", "population": 173000},
+    {"nom": "Saint-Étienne", "code": "99999", "codeDepartement": "42", "codeRegion": "84", "population": 100},
+    {"nom": "Paris", "code": "75056", "centre": {"coordinates": [2.35, 48.86]}, "codeDepartement": "75",
+     "codeRegion": "11", "population": 2100000},
+]
+
+
+def test_normalize_name():
+    assert normalize_name("Saint-Étienne-du-Rouvray") == "saint etienne du rouvray"
+    assert normalize_name("  L’Île   d'Yeu ") == "l ile d yeu"
+
+
+def test_lookup_exact_prefers_most_populated_homonym():
+    commune = Gazetteer(COMMUNES).lookup("saint etienne")
+    assert commune["code"] == "42218"
+    assert commune["longitude"] == 4.39 and commune["departement"] == "42"
+
+
+def test_lookup_approximate():
+    gazetteer = Gazetteer(COMMUNES)
+    assert gazetteer.lookup("Pariss")["code"] == "75056"
+    assert gazetteer.lookup("Marseille") is None
+
+
+def test_by_code_and_codes_in():
+    gazetteer = Gazetteer(COMMUNES)
+    assert gazetteer.by_code("99999")["latitude"] is None
+    assert gazetteer.by_code("00000") is None
+    assert gazetteer.codes_in(departement="42") == ["42218", "99999"]
+    assert gazetteer.codes_in(region="11") == ["75056"]
@@ -0,0 +1,48 @@
+import time
+from app.utils.pdf_cache import PdfCache
+
+
+def test_put_and_read(tmp_path):
+    cache = PdfCache(str(tmp_path))
+    sha256 = cache.put("https://a/dicrim.pdf", b"%PDF-1.4 dicrim", "texte", etag='"v1"')
+
+    entry = cache.lookup("https://a/dicrim.pdf")
+    assert entry["sha256"] == sha256 == PdfCache.hash(b"%PDF-1.4 dicrim")
+    assert cache.is_fresh(entry)
+    assert cache.revalidation_headers(entry) == {"If-None-Match": '"v1"'}
+    assert cache.read_text(sha256) == "texte"
+    assert cache.read_pdf(sha256) == b"%PDF-1.4 dicrim"
+    assert cache.lookup("https://b/plu.pdf") is None
+
+
+def test_same_content_is_shared_between_urls(tmp_path):
+    cache = PdfCache(str(tmp_path))
+    first = cache.put("https://a/dicrim.pdf", b"%PDF dicrim", "texte")
+    second = cache.put("https://miroir/dicrim.pdf", b"%PDF dicrim", "texte")
+    assert first == second
+    assert sorted(p.name for p in tmp_path.iterdir() if p.suffix in (".pdf", ".txt")) == [
+        f"{first}.pdf", f"{first}.txt"]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = PdfCache(str(tmp_path), max_bytes=40)
+    old = cache.put("https://a/ancien.pdf", b"%PDF ancien", "ancien")
+    time.sleep(0.01)
+    new = cache.put("https://a/recent.pdf", b"%PDF recent", "recent")
+    time.sleep(0.01)
+    cache.put("https://a/dernier.pdf", b"%PDF dernier", "dernier")
+
+    assert cache.read_text(old) is None and cache.lookup("https://a/ancien.pdf") is None
+    assert cache.read_text(new) == "recent"
+
+
+def test_shared_cache_is_created_on_first_use(tmp_path, monkeypatch):
+    from app.utils import pdf_cache
+
+    monkeypatch.setattr(pdf_cache, "_PDF_CACHE", None)
+    directory = tmp_path / "pdf"
+    assert not directory.exists()
+
+    cache = pdf_cache.get_pdf_cache(str(directory))
+    assert directory.is_dir()
+    assert pdf_cache.get_pdf_cache(str(directory)) is cache
@@ -0,0 +1,72 @@
+import pytest
+from app.planning.subtasks import plan_actions, CombinedPlan, SubTask
+from app.planning.templates import build_plan, normalize_niv_admin, select_examples
+
+
+VALIDATION = {"requete_valide": True, "message": "Risque d'inondation à Laon", "risques": ["Inondation"],
+              "lieux": ["Laon"], "niv_admin": "commune"}
+
+
+def test_build_plan_commune():
+    tasks = build_plan(VALIDATION)
+    assert [task["task"] for task in tasks] == ["SEARCH_DOCS", "ANALYZE_DOCS", "DATAVIZ", "SYNTHESIZE"]
+    assert tasks[0]["args"]["lieux"] == "Laon"
+    assert "DICRIM" in tasks[0]["args"]["docs"]
+    assert tasks[-1]["args"] == {"in": "analyze_output", "dataviz": "dataviz_output"}
+
+
+def test_build_plan_region_has_no_dataviz():
+    tasks = build_plan({**VALIDATION, "lieux": ["Bretagne"], "niv_admin": "Région"})
+    assert [task["task"] for task in tasks] == ["SEARCH_DOCS", "ANALYZE_DOCS", "SYNTHESIZE"]
+    assert tasks[0]["args"]["docs"] == ["SRADDET", "SDAGE"]
+
+
+@pytest.mark.parametrize("validation", [
+    {**VALIDATION, "lieux": ["Laon", "Paris"]},
+    {**VALIDATION, "niv_admin": "pays"},
+    {**VALIDATION, "niv_admin": None},
+])
+def test_build_plan_falls_back_to_llm(validation):
+    assert build_plan(validation) is None
+
+
+@pytest.mark.parametrize("niv_admin, expected", [
+    ("Commune", "commune"), ("groupement de communes", "groupement"), ("Métropole", "groupement"),
+    ("département", "departement"), ("Région", "région"), ("pays", None), (None, None),
+])
+def test_normalize_niv_admin(niv_admin, expected):
+    assert normalize_niv_admin(niv_admin) == expected
+
+
+def test_select_examples_keeps_both_verdicts():
+    examples = [
+        {"requete": "risque inondation Laon", "requete_valide": True},
+        {"requete": "risque inondation Paris", "requete_valide": True},
+        {"requete": "risque sécheresse Laon", "requete_valide": True},
+        {"requete": "recette de cuisine", "requete_valide": False},
+    ]
+    selected = select_examples("inondation à Laon", examples, k=2)
+    assert selected[0]["requete"] == "risque inondation Laon"
+    assert {example["requete_valide"] for example in selected} == {True, False}
+
+
+class FakePlanner:
+    def __init__(self):
+        self.calls = []
+
+    def converse_structured(self, model_id, messages, output_model, **kwargs):
+        self.calls.append(output_model)
+        return CombinedPlan(**VALIDATION, tasks=[SubTask.model_validate(task) for task in build_plan(VALIDATION)])
+
+
+def test_plan_actions_single_mode_uses_one_call():
+    client = FakePlanner()
+    planning = plan_actions(client, "validation", "planning", "Risque d'inondation à Laon ?", mode="single",
+                            use_cache=False)
+    assert [task.task for task in planning["tasks"]] == ["SEARCH_DOCS", "ANALYZE_DOCS", "DATAVIZ", "SYNTHESIZE"]
+    assert client.calls == [CombinedPlan]
+
+
+def test_plan_actions_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        plan_actions(FakePlanner(), "validation", "planning", "Risque d'inondation à Laon ?", mode="rapide")
@@ -0,0 +1,64 @@
+import io
+import json
+import time
+import pytest
+from app.utils.bedrock import ConverseMessage
+from app.utils.ratelimit import TokenBucket
+from tests.test_cache import fake_bedrock, response
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.04
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_token_bucket_rejects_invalid_parameters():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0, capacity=1)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=1, capacity=2).acquire(3)
+
+
+class CountingBucket(TokenBucket):
+    def __init__(self):
+        super().__init__(rate=1, capacity=1)
+        self.acquired = 0
+
+    def acquire(self, tokens: int = 1) -> None:
+        self.acquired += tokens
+
+
+def test_every_converse_request_is_rate_limited():
+    bedrock = fake_bedrock([response("coupé", "max_tokens"), response("a"), response("b")])
+    bedrock.rate_limiter = CountingBucket()
+    messages = [ConverseMessage.make_user_message("question")]
+
+    bedrock.converse_raw("model", messages)
+    bedrock.converse_raw("model", messages)
+    # réponse servie par le cache : pas de requête Bedrock
+    bedrock.converse_raw("model", messages)
+    bedrock.converse_raw("model", [ConverseMessage.make_user_message("autre")])
+    assert bedrock.rate_limiter.acquired == 3
+
+
+class EmbeddingClient:
+    def invoke_model(self, body, **kwargs):
+        return {"body": io.BytesIO(json.dumps({"embedding": [1.0, 0.0]}).encode())}
+
+
+def test_embedding_requests_use_their_own_rate_limiter():
+    bedrock = fake_bedrock([])
+    bedrock.bedrock = EmbeddingClient()
+    bedrock.rate_limiter = CountingBucket()
+    bedrock.embedding_rate_limiter = CountingBucket()
+
+    bedrock.get_embeddings(["a", "b", "a"])
+    # embedding servi par le cache : pas de requête Bedrock
+    bedrock.get_embedding("b")
+    assert bedrock.embedding_rate_limiter.acquired == 2
+    assert bedrock.rate_limiter.acquired == 0
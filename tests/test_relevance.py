@@ -0,0 +1,37 @@
+from app.utils.relevance import local_relevance
+
+DICRIM = ("Le document d'information communal sur les risques majeurs (DICRIM) de la commune présente "
+          "le risque inondation et les consignes de sécurité. ") * 20
+MENU = "Le menu du restaurant scolaire de la semaine comprend des pâtes et une salade de saison. " * 20
+
+
+def test_relevant_document():
+    decision, scores = local_relevance(DICRIM, "DICRIM", ["Inondation"])
+    assert decision is True
+    assert scores["gibberish"] == "ok"
+
+
+def test_off_topic_document():
+    assert local_relevance(MENU, "DICRIM")[0] is False
+
+
+def test_gibberish_document():
+    decision, scores = local_relevance("xq zz vvk 12 3 %% ### " * 50, "DICRIM")
+    assert decision is False
+    assert scores["gibberish"] == "gibberish"
+
+
+def test_decision_is_always_printed(capsys):
+    local_relevance(MENU, "DICRIM")
+    assert "local relevance DICRIM False" in capsys.readouterr().out
+
+
+GENERIC = ("La commune présente un risque inondation et un risque de sécheresse. Le plan de prévention, l'alerte, "
+           "les secours et la sauvegarde de la population face aux crues et aux incendies de forêt sont décrits. ") * 20
+
+
+def test_generic_risk_text_is_sent_to_the_llm():
+    for subject in ("SRADDET", "SDAGE", "Plan Local d'Urbanisme"):
+        decision, scores = local_relevance(GENERIC, subject, ["Inondation"])
+        assert scores["topic"] >= 20.0
+        assert decision is None
@@ -0,0 +1,32 @@
+import numpy as np
+from app.retrieval import add_page_markers, chunk_text, chunk_tokens, select_relevant_chunks
+
+PAGES = "\n".join(f"[page {n}]\n" + "".join(f"Ligne {n}.{i} du document sur les risques.\n" for i in range(40))
+                  for n in range(1, 6))
+
+
+def test_chunk_tokens_start_with_page_marker():
+    chunks = chunk_tokens(PAGES, max_tokens=300, overlap_tokens=20)
+    assert len(chunks) > 5
+    assert all(chunk.startswith("[page ") for chunk in chunks)
+
+
+def test_add_page_markers_uses_preceding_marker():
+    text = "[page 1]\nAlea inondation.\n[page 2]\nZonage du PPRI.\nConsignes.\n[page 3]\nAlerte."
+    chunks = ["[page 1]\nAlea inondation.", "Zonage du PPRI.", "Consignes.\n[page 3]\nAlerte.", "absent du texte"]
+    assert add_page_markers(text, chunks) == [
+        "[page 1]\nAlea inondation.", "[page 2]\nZonage du PPRI.", "[page 2]\nConsignes.\n[page 3]\nAlerte.",
+        "absent du texte"]
+
+
+class KeywordEmbeddings:
+    def get_embeddings(self, texts):
+        # un embedding par texte : présence du mot "inondation"
+        return np.array([[1.0, 0.0] if "inondation" in text.lower() else [0.0, 1.0] for text in texts])
+
+
+def test_selected_chunks_carry_page_markers():
+    doc = PAGES.replace("Ligne 4.3 du document sur les risques.", "Ligne 4.3 : zone exposée aux crues, inondation.")
+    selected = select_relevant_chunks(KeywordEmbeddings(), doc, ["Inondation"], top_k=1, chunk_size=500)
+    assert selected.startswith("[page 3]\n")
+    assert "inondation" in selected
@@ -0,0 +1,54 @@
+import pytest
+
+# les tâches de l'agent dépendent des bibliothèques de visualisation
+pytest.importorskip("folium")
+pytest.importorskip("plotly")
+
+from app.analysis import RiskAnalysisOutput
+from app.planning import tasks
+from app.planning.executor import AgentContext
+
+DOCS = [{"url": "https://a/dicrim.pdf", "pdf": "Le territoire est exposé aux inondations."}]
+
+
+def analyze(args: dict) -> list:
+    exec = AgentContext(None)
+    exec.register_task(tasks.analyze_documents)
+    exec.outputs["search_output"] = DOCS
+    return exec.tasks["ANALYZE_DOCS"](exec, args)
+
+
+@pytest.fixture
+def analyses(monkeypatch):
+    calls = []
+
+    def fake(mode):
+        def analyze(bedrock, doc, url, model_id, risques=None, **kwargs):
+            calls.append(mode)
+            return RiskAnalysisOutput(risques=[], note=5, explication=mode, url=url)
+        return analyze
+
+    monkeypatch.setattr(tasks, "analyze_doc_risks", fake("retrieval"))
+    monkeypatch.setattr(tasks, "analyze_doc_risks_map_reduce", fake("map_reduce"))
+    monkeypatch.setattr(tasks, "select_relevant_chunks", lambda bedrock, doc, *args, **kwargs: doc)
+    return calls
+
+
+def test_analysis_mode_from_environment(monkeypatch, analyses):
+    monkeypatch.setenv("ANALYSIS_MODE", "map_reduce")
+    assert analyze({"in": "search_output"})[0].explication == "map_reduce"
+    # l'argument de la sous-tâche l'emporte sur la configuration
+    analyze({"in": "search_output", "mode": "retrieval"})
+    assert analyses == ["map_reduce", "retrieval"]
+
+
+def test_analysis_mode_default(monkeypatch, analyses):
+    monkeypatch.delenv("ANALYSIS_MODE", raising=False)
+    analyze({"in": "search_output"})
+    assert analyses == ["retrieval"]
+
+
+def test_invalid_analysis_mode(monkeypatch, analyses):
+    monkeypatch.setenv("ANALYSIS_MODE", "complet")
+    with pytest.raises(ValueError):
+        analyze({"in": "search_output"})
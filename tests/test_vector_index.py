@@ -0,0 +1,50 @@
+import sqlite3
+import numpy as np
+import pytest
+from app.utils.vector_index import VectorIndex
+
+
+def test_documents_for_filters_doc_types(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    index.add_document("https://a/dicrim.pdf", "02408", "dicrim", "DICRIM")
+    index.add_document("https://a/plu.pdf", "02408", "plu", "Plan Local d'Urbanisme")
+    index.add_document("https://b/dicrim.pdf", "75056", "dicrim", "DICRIM")
+
+    assert {doc["url"] for doc in index.documents_for("02408")} == {"https://a/dicrim.pdf", "https://a/plu.pdf"}
+    assert index.documents_for("02408", ["DICRIM"]) == [
+        {"url": "https://a/dicrim.pdf", "pdf": "dicrim", "doc": "DICRIM", "insee": "02408"}]
+    assert index.documents_for("02408", ["Plan Communal de Sauvegarde"]) == []
+
+
+def test_documents_table_migration(tmp_path):
+    with sqlite3.connect(tmp_path / "index.sqlite") as db:
+        db.execute("CREATE TABLE documents (url TEXT PRIMARY KEY, insee TEXT, text TEXT NOT NULL, added_at REAL NOT NULL)")
+    index = VectorIndex(str(tmp_path))
+    index.add_document("https://a/dicrim.pdf", "02408", "dicrim", "DICRIM")
+    assert index.documents_for("02408", ["DICRIM"])[0]["doc"] == "DICRIM"
+
+
+def test_analysis_key_is_normalized(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    index.add_analysis("https://a/dicrim.pdf", ["Inondation", "séisme"], {"ok": True})
+    assert index.get_analysis("https://a/dicrim.pdf", ["Séisme ", "inondation", "inondation"]) == {"ok": True}
+    assert index.get_analysis("https://a/dicrim.pdf", ["inondation"]) is None
+
+
+def test_chunks_and_search(tmp_path):
+    index = VectorIndex(str(tmp_path))
+    index.add_document("https://a/dicrim.pdf", "02408", "dicrim", "DICRIM")
+    index.add_document("https://b/dicrim.pdf", "75056", "dicrim", "DICRIM")
+    index.add_chunks("https://a/dicrim.pdf", ["inondation", "sécheresse"], np.array([[1, 0], [0, 1]]))
+    index.add_chunks("https://b/dicrim.pdf", ["crue"], np.array([[0.9, 0.1]]))
+
+    chunks, embeddings = index.get_chunks("https://a/dicrim.pdf")
+    assert chunks == ["inondation", "sécheresse"]
+    assert embeddings.dtype == np.float32 and embeddings.shape == (2, 2)
+    assert index.get_chunks("https://c/plu.pdf") is None
+
+    results = index.search(np.array([1, 0]), top_k=2)
+    assert [r["chunk"] for r in results] == ["inondation", "crue"]
+    assert [r["chunk"] for r in index.search(np.array([1, 0]), insee="75056")] == ["crue"]
+    with pytest.raises(ValueError):
+        index.add_chunks("https://c/plu.pdf", ["plu"], np.ones((1, 3)))